@@ -0,0 +1,122 @@
+'''
+Benchmark of the cold startup of the GUI.
+
+    python benchmarks/bench_startup.py [--runs 10]
+
+Starts Gnotran in fresh processes, with a config of its own in a
+temporary directory, and reports the median time to import the modules,
+to the first show_all of the main window and to its first drawn frame,
+and the whole process up to then.  Needs a display.
+'''
+
+import ConfigParser
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# layouts: config settings
+LAYOUTS = (
+    ('full', {'one_direction': 'false', 'hide_toolbar': 'false'}),
+    ('minimal', {'one_direction': 'true', 'hide_toolbar': 'true'}),
+    ('first run', None),
+)
+
+
+def run_case(directory):
+    ''' Start the main window once, return the measurements '''
+    started = time.time()
+    sys.path.insert(0, ROOT)
+    import gtk
+    import gnotran
+    imported = time.time()
+    gnotran.C_F_P = os.path.join(directory, 'gnotran.cfg')
+    gnotran.T_M_P = os.path.join(directory, 'gnotran-memory.sqlite')
+    gnotran.gobject.threads_init()
+    # MainWindow ends with show_all
+    gnotran.MainWindow()
+    shown = time.time()
+    while gtk.events_pending():
+        gtk.main_iteration(False)
+    drawn = time.time()
+    return {'import': imported - started,
+            'show_all': shown - started,
+            'first_frame': drawn - started,
+            'config_written': os.path.exists(gnotran.C_F_P)}
+
+
+def write_config(path, settings):
+    config = ConfigParser.RawConfigParser()
+    config.add_section('Translator')
+    for option, value in settings.items():
+        config.set('Translator', option, value)
+    with open(path, 'wb') as f:
+        config.write(f)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def make_parser():
+    parser = OptionParser(usage='python benchmarks/bench_startup.py [options]')
+    parser.add_option('--runs', type='int', default=10,
+                      help='starts of every layout [%default]')
+    parser.add_option('--json', default=None, metavar='FILE',
+                      help='also write the results to FILE, for comparing runs')
+    # used by the benchmark for its child processes
+    parser.add_option('--case', default=None, metavar='DIR', help='start once, config in DIR')
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    options, args = parser.parse_args(argv)
+    if options.case:
+        print json.dumps(run_case(options.case))
+        return 0
+
+    print '%-10s %9s %11s %14s %11s' % ('layout', 'import ms', 'show_all ms', 'first frame ms', 'process ms')
+    results = []
+    for layout, settings in LAYOUTS:
+        runs = []
+        for i in range(options.runs):
+            directory = tempfile.mkdtemp(prefix='gnotran-startup-')
+            try:
+                if settings is not None:
+                    write_config(os.path.join(directory, 'gnotran.cfg'), settings)
+                started = time.time()
+                output = subprocess.check_output(
+                    [sys.executable, os.path.abspath(__file__), '--case', directory])
+                result = json.loads(output.splitlines()[-1])
+                # with the interpreter startup
+                result['process'] = time.time() - started
+                runs.append(result)
+            finally:
+                shutil.rmtree(directory)
+        result = dict((name, median([run[name] for run in runs]))
+                      for name in ('import', 'show_all', 'first_frame', 'process'))
+        result['layout'] = layout
+        result['config_written'] = any(run['config_written'] for run in runs)
+        results.append(result)
+        print '%-10s %9.1f %11.1f %14.1f %11.1f' % (
+            layout, result['import'] * 1000, result['show_all'] * 1000,
+            result['first_frame'] * 1000, result['process'] * 1000)
+        sys.stdout.flush()
+    if any(result['config_written'] for result in results if result['layout'] == 'first run'):
+        print 'Warning: the first run wrote a config file.'
+    if options.json:
+        with open(options.json, 'wb') as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
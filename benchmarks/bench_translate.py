@@ -0,0 +1,160 @@
+'''
+Benchmark of the translation pipeline against local mock servers.
+
+    python benchmarks/bench_translate.py [options]
+
+Starts the mock Google and Microsoft services (see mock_servers.py) and
+translates generated documents of every size with every translator,
+each in a fresh process so that its peak memory is its own.  Reports
+lines/sec, request latency percentiles and peak memory (max RSS).
+'''
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from translator import Engine, GoogleBackend, MicrosoftBackend, HedgedBackend
+from translator import SegmentCache, ConnectionPool, AdaptiveLimiter, BatchStats
+from mock_servers import MockServer
+
+
+SIZES = '10,100,1000,10000,100000'
+APIS = 'Google,Microsoft,Auto'
+
+
+def document(lines):
+    ''' Distinct lines of a generated document '''
+    for i in xrange(lines):
+        yield u'Line %d: the quick brown fox jumps over the lazy dog %d times.' % (i, i * 7)
+
+
+def percentile(values, p):
+    ''' Nearest-rank percentile of a sorted list '''
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def peak_mb():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def timed(http, latencies):
+    ''' Record the latency of every request of a ConnectionPool, without
+    the time spent waiting for a free connection slot; failed requests
+    count with their whole time '''
+    request = http.request
+    def request_timed(*args, **kwargs):
+        started = time.time()
+        try:
+            response = request(*args, **kwargs)
+        except Exception:
+            latencies.append(time.time() - started)
+            raise
+        latencies.append(response.latency)
+        return response
+    http.request = request_timed
+
+
+def run_case(api, lines, options):
+    ''' Translate one document, return the measurements '''
+    http = ConnectionPool(options.workers)
+    latencies = []
+    timed(http, latencies)
+    backends = []
+    for cls, url in ((GoogleBackend, options.google_url), (MicrosoftBackend, options.microsoft_url)):
+        backend = cls(http, limiter=AdaptiveLimiter(maximum=options.workers))
+        backend.url = url
+        backends.append(backend)
+    backends.append(HedgedBackend(backends[:], options.workers))
+    workers = dict((backend.name, options.workers) for backend in backends)
+    engine = Engine(backends, workers, SegmentCache())
+
+    stats = BatchStats()
+    for translation in engine.translate_stream(api, document(lines), 'en', 'de', stats=stats):
+        pass
+    stats.finish()
+    latencies.sort()
+    return {'api': api,
+            'lines': lines,
+            'seconds': stats.elapsed(),
+            'lines_per_sec': lines / max(stats.elapsed(), 1e-6),
+            'requests': len(latencies),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'failed': len(stats.failed),
+            'peak_mb': peak_mb()}
+
+
+def make_parser():
+    parser = OptionParser(usage='python benchmarks/bench_translate.py [options]')
+    parser.add_option('--sizes', default=SIZES,
+                      help='lines of the documents, comma-separated [%default]')
+    parser.add_option('--apis', default=APIS,
+                      help='translators, comma-separated [%default]')
+    parser.add_option('-w', '--workers', type='int', default=4,
+                      help='concurrent requests per translator [%default]')
+    parser.add_option('--latency', type='float', default=0.05,
+                      help='mean response time of the mock servers, seconds [%default]')
+    parser.add_option('--jitter', type='float', default=0.02,
+                      help='standard deviation of the response time [%default]')
+    parser.add_option('--errors', type='float', default=0.01,
+                      help='part of requests failing with 503 [%default]')
+    parser.add_option('--json', default=None, metavar='FILE',
+                      help='also write the results to FILE, for comparing runs')
+    # used by the benchmark for its child processes
+    parser.add_option('--case', nargs=2, default=None, help='API LINES: run one case')
+    parser.add_option('--google-url', default=None)
+    parser.add_option('--microsoft-url', default=None)
+    return parser
+
+
+def main(argv=None):
+    parser = make_parser()
+    options, args = parser.parse_args(argv)
+    if options.case:
+        api, lines = options.case
+        print json.dumps(run_case(api, int(lines), options))
+        return 0
+
+    server = MockServer(options.latency, options.jitter, options.errors).start()
+    print 'Mock servers: latency %.0f ms, jitter %.0f ms, errors %.1f%%, %d workers' % (
+        options.latency * 1000, options.jitter * 1000, options.errors * 100, options.workers)
+    print '%-10s %7s %10s %8s %8s %8s %8s %8s %7s' % (
+        'api', 'lines', 'lines/sec', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'peak MB', 'failed')
+    results = []
+    try:
+        for api in options.apis.split(','):
+            for lines in options.sizes.split(','):
+                output = subprocess.check_output(
+                    [sys.executable, os.path.abspath(__file__), '--case', api, lines,
+                     '--workers', str(options.workers),
+                     '--google-url', server.google_url,
+                     '--microsoft-url', server.microsoft_url])
+                result = json.loads(output.splitlines()[-1])
+                results.append(result)
+                print '%-10s %7d %10.1f %8d %8.1f %8.1f %8.1f %8.1f %7d' % (
+                    result['api'], result['lines'], result['lines_per_sec'], result['requests'],
+                    result['p50'] * 1000, result['p95'] * 1000, result['p99'] * 1000,
+                    result['peak_mb'], result['failed'])
+                sys.stdout.flush()
+    finally:
+        server.stop()
+    print 'Server: %d requests answered, %d failed on purpose.' % (server.requests, server.failed)
+    if options.json:
+        with open(options.json, 'wb') as f:
+            json.dump(results, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
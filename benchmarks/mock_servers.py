@@ -0,0 +1,162 @@
+'''
+Local stand-ins for the Google and Microsoft translation services.
+
+Both answer in the shape of the real service, after a configurable
+latency with jitter, and fail a configurable part of the requests with
+"503 Service Unavailable".  The "translation" is the text with the
+target language in front of it.
+
+    python benchmarks/mock_servers.py [--latency 0.05] [--jitter 0.02] [--errors 0.01]
+
+runs both until interrupted and prints their URLs.
+'''
+
+import json
+import random
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from optparse import OptionParser
+
+
+GOOGLE_PATH = '/ajax/services/language/translate'
+MICROSOFT_PATH = '/V2/Ajax.svc/TranslateArray'
+
+
+def fake_translation(text, c_to):
+    return u'[%s] %s' % (c_to, text)
+
+
+def google_response(query):
+    ''' Body of a Google AJAX Language API answer '''
+    c_to = query['langpair'][0].split('|')[-1]
+    answers = [{'responseData': {'translatedText': fake_translation(text.decode('utf-8'), c_to)},
+                'responseDetails': None, 'responseStatus': 200}
+               for text in query.get('q', [])]
+    # one "q" gets a single answer, several get a list
+    if len(answers) == 1:
+        return json.dumps(answers[0])
+    return json.dumps({'responseData': answers, 'responseDetails': None, 'responseStatus': 200})
+
+
+def microsoft_response(query):
+    ''' Body of a Microsoft Translator TranslateArray JSONP answer '''
+    c_from = query['from'][0]
+    c_to = query['to'][0]
+    texts = json.loads(query['texts'][0])
+    answers = [{'From': c_from,
+                'OriginalTextSentenceLengths': [len(text)],
+                'TranslatedText': fake_translation(text, c_to),
+                'TranslatedTextSentenceLengths': [len(text) + len(c_to) + 3]}
+               for text in texts]
+    return '%s(%s);' % (query['oncomplete'][0], json.dumps(answers))
+
+
+RESPONSES = {
+    GOOGLE_PATH: google_response,
+    MICROSOFT_PATH: microsoft_response,
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep-alive, like the real services
+    protocol_version = 'HTTP/1.1'
+    # one send per response: separate small writes stall on delayed ACKs
+    wbufsize = -1
+
+    def do_GET(self):
+        server = self.server
+        server.count()
+        path, _, query = self.path.partition('?')
+        delay = random.gauss(server.latency, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if path not in RESPONSES:
+            return self.answer(404, 'Not Found')
+        if random.random() < server.errors:
+            server.count(failed=True)
+            return self.answer(503, 'Service Unavailable')
+        try:
+            body = RESPONSES[path](urlparse.parse_qs(query))
+        except (KeyError, ValueError), e:
+            return self.answer(400, str(e))
+        self.answer(200, body)
+
+    def answer(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/javascript; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    ''' Both services on one port of localhost, in a background thread '''
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, jitter=0.02, errors=0.0, port=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = errors
+        self.requests = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def count(self, failed=False):
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.requests += 1
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server_address[1], path)
+
+    @property
+    def google_url(self):
+        return self.url(GOOGLE_PATH)
+
+    @property
+    def microsoft_url(self):
+        return self.url(MICROSOFT_PATH)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='mock-server')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = OptionParser(usage='python benchmarks/mock_servers.py [options]')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--latency', type='float', default=0.05,
+                      help='mean response time, seconds [%default]')
+    parser.add_option('--jitter', type='float', default=0.02,
+                      help='standard deviation of the response time [%default]')
+    parser.add_option('--errors', type='float', default=0.01,
+                      help='part of requests answered with 503 [%default]')
+    options, args = parser.parse_args()
+    server = MockServer(options.latency, options.jitter, options.errors, options.port)
+    print 'Google:   ', server.google_url
+    print 'Microsoft:', server.microsoft_url
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
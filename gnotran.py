@@ -17,17 +17,184 @@ __copyright__ = 'Copyright (c) 2010-2011 Nikolay Blohin'
 __license__ = 'GNU General Public License'
 
 import os
-import json
-import urllib
+import difflib
 import threading
+import gobject
 import gtk
 import pango
 import ConfigParser
+from optparse import OptionParser
+
+from translator import ThreadPool, Engine, Job, Cancelled, GoogleBackend, MicrosoftBackend, HedgedBackend
+from translator import TranslationMemory, SegmentCache, ConnectionPool, AdaptiveLimiter, LANGUAGES
+from translator import translate_file, checkpoint_path, adapt, import_file, export_file
+from translator import recorder, JsonLinesExporter, Profile, profiled, profiling
 
 
 ABS_Path = os.path.realpath(os.path.dirname(__file__))
 IMAGES_dir = os.path.join(ABS_Path, 'images')
 C_F_P = os.path.join(ABS_Path, 'gnotran.cfg')
+# pause in typing (ms) after which live translation starts
+LIVE_DELAY = 700
+# widget updates from worker threads are drawn at most once per frame (ms)
+FRAME = 40
+T_M_P = os.path.join(ABS_Path, 'gnotran-memory.sqlite')
+WORDNIK_KEY = 'dd675e8c15076cfab74220264da05468a5f14d1e46b5f63cc'
+
+# settings of the first release
+DEFAULT_OPTIONS = (
+    ('api', 'Google'),
+    ('lang_from', 'english'),
+    ('lang_to', 'russian'),
+    ('one_direction', 'false'),
+    ('hide_toolbar', 'false'),
+)
+
+# settings added after the first release, filled in for old config files
+NEW_OPTIONS = (
+    ('batch_max_lines', '50'),
+    ('batch_max_chars', '1500'),
+    ('google_workers', '4'),
+    ('microsoft_workers', '4'),
+    ('cache_only', 'false'),
+    ('tm_max_entries', '200000'),
+    ('tm_max_age_days', '180'),
+    ('cache_max_bytes', '16777216'),
+    ('http_per_host', '4'),
+    ('http_idle_timeout', '30'),
+    ('live', 'false'),
+    ('google_max_rps', '0'),
+    ('microsoft_max_rps', '0'),
+    ('request_timeout', '15'),
+    ('retries', '3'),
+    ('fuzzy_threshold', '0.7'),
+    ('fuzzy_translate', 'false'),
+    ('metrics_log', ''),
+)
+
+# pixbufs by file name, loaded once for all windows
+_pixbufs = {}
+
+
+def pixbuf(name):
+    ''' Picture of the images directory, loaded on first use '''
+    if name not in _pixbufs:
+        _pixbufs[name] = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, name))
+    return _pixbufs[name]
+
+
+def image(name):
+    ''' New gtk.Image of a picture of the images directory '''
+    widget = gtk.Image()
+    widget.set_from_pixbuf(pixbuf(name))
+    return widget
+
+
+class UpdateQueue(object):
+    ''' Widget updates queued by worker threads and run by the main loop
+
+    Worker threads never touch widgets or take the gdk lock: they queue
+    callbacks, and the main loop runs everything queued once per frame.
+    Updates with the same key are merged, so a fast job redraws a
+    progressbar or appends to a buffer once per frame, not once per line.
+    Keyed updates run at the place of their first update.
+    '''
+    def __init__(self, frame=FRAME):
+        self.frame = frame
+        self.lock = threading.Lock()
+        self.updates = []
+        self.keyed = {}
+        self.scheduled = False
+
+
+    def put(self, func, *args):
+        ''' Run func(*args) on the main loop '''
+        with self.lock:
+            self.updates.append((func, args))
+            self._schedule()
+
+
+    def set(self, key, func, *args):
+        ''' Like put, but only the last update with the key runs '''
+        with self.lock:
+            entry = self.keyed.get(key)
+            if entry is None:
+                self.keyed[key] = entry = [func, args]
+                self.updates.append(entry)
+            entry[:] = [func, args]
+            self._schedule()
+
+
+    def extend(self, key, func, item):
+        ''' Collect items with the key and run func(items) once for all of them '''
+        with self.lock:
+            entry = self.keyed.get(key)
+            if entry is None:
+                self.keyed[key] = entry = [func, ([],)]
+                self.updates.append(entry)
+            entry[1][0].append(item)
+            self._schedule()
+
+
+    def _schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            gobject.timeout_add(self.frame, self.drain)
+
+
+    def drain(self):
+        ''' Run the queued updates, on the main loop '''
+        with self.lock:
+            updates, self.updates = self.updates, []
+            self.keyed = {}
+            self.scheduled = False
+        for func, args in updates:
+            func(*args)
+        return False
+
+
+# shared by all windows
+updates = UpdateQueue()
+
+
+# Wordnik client and threads for its calls, shared by all dictionary windows
+_dictionary = None
+_dictionary_lock = threading.Lock()
+
+
+def dictionary():
+    ''' (Wordnik client, ThreadPool), created on first use '''
+    global _dictionary
+    with _dictionary_lock:
+        if _dictionary is None:
+            from wordnik import Wordnik
+            # keep-alive connections, and calls in the request statistics
+            wordnik = Wordnik(api_key=WORDNIK_KEY, pool=ConnectionPool(), recorder=recorder)
+            _dictionary = wordnik, ThreadPool(3, 'dictionary')
+        return _dictionary
+
+
+def replace_lines(buffer, i1, i2, lines):
+    ''' Replace lines i1 to i2 (exclusive) of a TextBuffer with lines '''
+    count = buffer.get_line_count()
+    if i2 < count:
+        start = buffer.get_iter_at_line(i1)
+        end = buffer.get_iter_at_line(i2)
+        text = ''.join(line + '\n' for line in lines)
+    elif i1 > 0:
+        # up to the end: take the newline before line i1 instead of after
+        if i1 < count:
+            start = buffer.get_iter_at_line(i1)
+            start.backward_char()
+        else:
+            start = buffer.get_end_iter()
+        end = buffer.get_end_iter()
+        text = ''.join('\n' + line for line in lines)
+    else:
+        start, end = buffer.get_bounds()
+        text = '\n'.join(lines)
+    buffer.delete(start, end)
+    buffer.insert(start, text)
 
 
 class DictWindow(gtk.Window):
@@ -35,12 +202,14 @@ class DictWindow(gtk.Window):
         super(DictWindow, self).__init__()
         self.from_lang = from_lang
         self.to_lang = to_lang
+        # the last search, only its result is shown
+        self.search = None
         
         self.set_title('Dictionary')
         self.set_size_request(400, 500)
         self.set_position(gtk.WIN_POS_CENTER)
         self.connect('destroy', self.close)
-        self.set_icon_from_file(os.path.join(IMAGES_dir, 'dictionary-32x32.png'))
+        self.set_icon(pixbuf('dictionary-32x32.png'))
 
         # search string
         self.vbox = gtk.VBox(False)
@@ -135,96 +304,98 @@ class DictWindow(gtk.Window):
 
     def s_button_clicked(self, widget):
         '''Search word and show result'''
-        def request_to_server(self, word):
-            from wordnik import Wordnik
-            bar_id = self.statusbar.get_context_id('statusbar')
-            gtk.gdk.threads_enter()
-            self.statusbar.push(bar_id, 'Request to server...')
-            gtk.gdk.threads_leave()
+        def request_to_server(self, search, word):
             try:
-                w = Wordnik(api_key='dd675e8c15076cfab74220264da05468a5f14d1e46b5f63cc')
-                definitions = w.word_get_definitions(word)
-                examples = w.word_get_examples(word)
-                related = w.word_get_related(word)
+                w, pool = dictionary()
+                # the three calls at once
+                calls = [pool.submit(method, word) for method in
+                         (w.word_get_definitions, w.word_get_examples, w.word_get_related)]
+                definitions, examples, related = [call.result() for call in calls]
             except:
                 definitions = False
                 examples = False
                 related = False
+            updates.put(self.show_result, search, word, definitions, examples, related)
 
 
-            if definitions:
-                # colect name for all partOfSpeech in definitions
-                p_o_s = []
-                for i in definitions:
-                    if not(i['partOfSpeech'] in p_o_s):
-                        p_o_s.append(i['partOfSpeech'])
-                p_o_s.sort()
-
-                # write definitions
-                my_iter = self.buffer.get_start_iter()
-                for p in p_o_s:
-                    tmp = p.capitalize() + '\n'
-                    self.buffer.insert_with_tags_by_name(my_iter, tmp, 'header')
-                    for d in definitions:
-                        if d['partOfSpeech']==p:
-                            self.buffer.insert(my_iter, d['text'])
-                            self.buffer.insert(my_iter, '\n\n') 
-
-
-            if examples:
-                # write examples
-                my_iter = self.buffer_2.get_start_iter() 
-                for p in examples['examples']:
-                    title = p['title'] + '\n'
-                    text = p['text'] + '\n'
-                    self.buffer_2.insert_with_tags_by_name(my_iter, title, 'title')
-                    self.buffer_2.insert(my_iter, text)
-                    self.buffer_2.insert(my_iter, '\n\n')
-
-                # highlighting words in examples
-                search_str =  word
-                start_iter =  self.buffer_2.get_start_iter()
-                s = True
-                while s:
-                    found = start_iter.forward_search(search_str, 0, None)
-                    if found:
-                        match_start, match_end = found # add this line to get match_start and match_end
-                        self.buffer_2.apply_tag_by_name('highlight', match_start, match_end)
-                        start_iter =  match_end
-                    else:
-                        s = False
-
-            if related:
-                # write related
-                my_iter = self.buffer_3.get_start_iter()
-                for p in related[0]['words']:
-                    text = p + '\n\n'
-                    self.buffer_3.insert(my_iter, text)
-
-
-            gtk.gdk.threads_enter()
-            self.statusbar.pop(bar_id)
-            if (definitions and examples and related):
-                self.statusbar.push(bar_id, 'Request successfully completed.')
-            else:
-                self.statusbar.push(bar_id, 'Request Error. Try again later.')
-            gtk.gdk.threads_leave()
-
-
-            
         # clear text field
         self.buffer.set_text('')        
         self.buffer_2.set_text('')        
         self.buffer_3.set_text('')        
         word = self.word.get_text()
-        mythread = threading.Thread(target=request_to_server, args=(self, word))
+        bar_id = self.statusbar.get_context_id('statusbar')
+        self.statusbar.push(bar_id, 'Request to server...')
+        self.search = object()
+        mythread = threading.Thread(target=profiled('dictionary', request_to_server), args=(self, self.search, word))
         mythread.start()
-        
 
 
+    def show_result(self, search, word, definitions, examples, related):
+        ''' Write the result of a search, on the main loop '''
+        if search is not self.search:
+            # a newer search was started or the window was closed
+            return
+        if definitions:
+            # colect name for all partOfSpeech in definitions
+            p_o_s = []
+            for i in definitions:
+                if not(i['partOfSpeech'] in p_o_s):
+                    p_o_s.append(i['partOfSpeech'])
+            p_o_s.sort()
+
+            # write definitions
+            my_iter = self.buffer.get_start_iter()
+            for p in p_o_s:
+                tmp = p.capitalize() + '\n'
+                self.buffer.insert_with_tags_by_name(my_iter, tmp, 'header')
+                for d in definitions:
+                    if d['partOfSpeech']==p:
+                        self.buffer.insert(my_iter, d['text'])
+                        self.buffer.insert(my_iter, '\n\n') 
+
+
+        if examples:
+            # write examples
+            my_iter = self.buffer_2.get_start_iter() 
+            for p in examples['examples']:
+                title = p['title'] + '\n'
+                text = p['text'] + '\n'
+                self.buffer_2.insert_with_tags_by_name(my_iter, title, 'title')
+                self.buffer_2.insert(my_iter, text)
+                self.buffer_2.insert(my_iter, '\n\n')
+
+            # highlighting words in examples
+            search_str =  word
+            start_iter =  self.buffer_2.get_start_iter()
+            s = True
+            while s:
+                found = start_iter.forward_search(search_str, 0, None)
+                if found:
+                    match_start, match_end = found # add this line to get match_start and match_end
+                    self.buffer_2.apply_tag_by_name('highlight', match_start, match_end)
+                    start_iter =  match_end
+                else:
+                    s = False
+
+        if related:
+            # write related
+            my_iter = self.buffer_3.get_start_iter()
+            for p in related[0]['words']:
+                text = p + '\n\n'
+                self.buffer_3.insert(my_iter, text)
+
+
+        bar_id = self.statusbar.get_context_id('statusbar')
+        self.statusbar.pop(bar_id)
+        if (definitions and examples and related):
+            self.statusbar.push(bar_id, 'Request successfully completed.')
+        else:
+            self.statusbar.push(bar_id, 'Request Error. Try again later.')
+
 
     def close(self, widget):
         ''' Close DictWindow '''
+        self.search = None
         self.destroy()
 
 
@@ -234,122 +405,47 @@ class MainWindow(gtk.Window):
     def __init__(self):
         super(MainWindow, self).__init__()
 
-        self.all_lang = {
-            'afrikaans':'af',
-            'albanian':'sq',
-            'amharic':'am',
-            'arabic':'ar',
-            'armenian':'hy',
-            'azerbaijani':'az',
-            'basque':'eu',
-            'belarusian':'be',
-            'bengali':'bn',
-            'bihari':'bh',
-            'bulgarian':'bg',
-            'burmese':'my',
-            'catalan':'ca',
-            'cherokee':'chr',
-            'chinese':'zh',
-            'chinese_simplified':'zh-cn',
-            'chinese_traditional':'zh-tw',
-            'croatian':'hr',
-            'czech':'cs',
-            'danish':'da',
-            'dhivehi':'dv',
-            'dutch':'nl',
-            'english':'en',
-            'esperanto':'eo',
-            'estonian':'et',
-            'filipino':'tl',
-            'finnish':'fi',
-            'french':'fr',
-            'galician':'gl',
-            'georgian':'ka',
-            'german':'de',
-            'greek':'el',
-            'guarani':'gn',
-            'gujarati':'gu',
-            'hebrew':'iw',
-            'hindi':'hi',
-            'hungarian':'hu',
-            'icelandic':'is',
-            'indonesian':'id',
-            'inuktitut':'iu',
-            'italian':'it',
-            'japanese':'ja',
-            'kannada':'kn',
-            'kazakh':'kk',
-            'khmer':'km',
-            'korean':'ko',
-            'kurdish':'ku',
-            'kyrgyz':'ky',
-            'laothian':'lo',
-            'latvian':'lv',
-            'lithuanian':'lt',
-            'macedonian':'mk',
-            'malay':'ms',
-            'malayalam':'ml',
-            'maltese':'mt',
-            'marathi':'mr',
-            'mongolian':'mn',
-            'nepali':'ne',
-            'norwegian':'no',
-            'oriya':'or',
-            'pashto':'ps',
-            'persian':'fa',
-            'polish':'pl',
-            'portuguese':'pt-pt',
-            'punjabi':'pa',
-            'romanian':'ro',
-            'russian':'ru',
-            'sanskrit':'sa',
-            'serbian':'sr',
-            'sindhi':'sd',
-            'sinhalese':'si',
-            'slovak':'sk',
-            'slovenian':'sl',
-            'spanish':'es',
-            'swahili':'sw',
-            'swedish':'sv',
-            'tajik':'tg',
-            'tamil':'ta',
-            'tagalog':'tl',
-            'telugu':'te',
-            'thai':'th',
-            'tibetan':'bo',
-            'turkish':'tr',
-            'ukrainian':'uk',
-            'urdu':'ur',
-            'uzbek':'uz',
-            'uighur':'ug',
-            'vietnamese':'vi',
-        }
+        self.all_lang = LANGUAGES
 
         # Read config file
         self.config = ConfigParser.RawConfigParser()
         try:
             self.config.read(C_F_P)
-            self.config.get('Translator', 'lang_from')
-        except:
-            # first run, write default settings to config
+        except ConfigParser.Error:
+            # broken file, start with default settings
+            self.config = ConfigParser.RawConfigParser()
+        if not self.config.has_section('Translator'):
+            # first run: default settings, written on the first change
             self.config.add_section('Translator')
-            self.config.set('Translator', 'api', 'Google')
-            self.config.set('Translator', 'lang_from', 'english')
-            self.config.set('Translator', 'lang_to', 'russian')
-            self.config.set('Translator', 'one_direction', 'false')
-            self.config.set('Translator', 'hide_toolbar', 'false')
-            with open(C_F_P, 'wb') as configfile:
-                self.config.write(configfile)
-                
-            
+
+        for option, value in DEFAULT_OPTIONS + NEW_OPTIONS:
+            if not self.config.has_option('Translator', option):
+                self.config.set('Translator', option, value)
+
         self.api_for_use = self.config.get('Translator', 'api')
         self.from_lang = self.config.get('Translator', 'lang_from')
         self.to_lang = self.config.get('Translator', 'lang_to')
         self.one_direction = self.config.getboolean('Translator', 'one_direction')
         self.hide_toolbar = self.config.getboolean('Translator', 'hide_toolbar')
+        # the engine and translation memory are created on first use
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self.cache_only = self.config.getboolean('Translator', 'cache_only')
+        # similarity of memory matches offered, and used instead of requests
+        self.fuzzy_threshold = self.config.getfloat('Translator', 'fuzzy_threshold')
+        self.fuzzy = None
+        if self.config.getboolean('Translator', 'fuzzy_translate'):
+            self.fuzzy = self.fuzzy_threshold
+        # running translation of every pane, by button name
+        self.jobs = {}
+        # last translated text of every pane:
+        # ((api, c_from, c_to), source lines, translated lines, failed line numbers)
+        self.snapshots = {}
+        self.live = self.config.getboolean('Translator', 'live')
+        self.live_timers = {}
 
         self.set_title('Gnotran - simple Gnome client for translators')
-        self.set_icon_from_file(os.path.join(IMAGES_dir, 'gnotran-64x64.png'))
+        self.set_icon(pixbuf('gnotran-64x64.png'))
         self.set_default_size(650, 550)
         self.set_resizable(True)
         self.set_position(gtk.WIN_POS_CENTER)
@@ -358,21 +454,10 @@ class MainWindow(gtk.Window):
         # text menu ***********************************************************
 
         # images for menubar
-        img1 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'language-16x16.png'))
-        image_1 = gtk.Image()
-        image_1.set_from_pixbuf(img1)
-
-        img2 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'about-16x16.png'))
-        image_2 = gtk.Image()
-        image_2.set_from_pixbuf(img2)
-
-        img3 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'dictionary-16x16.png'))
-        image_3 = gtk.Image()
-        image_3.set_from_pixbuf(img3)
-
-        img4 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'api-16x16.png'))
-        image_4 = gtk.Image()
-        image_4.set_from_pixbuf(img4)
+        image_1 = image('language-16x16.png')
+        image_2 = image('about-16x16.png')
+        image_3 = image('dictionary-16x16.png')
+        image_4 = image('api-16x16.png')
 
 
         # file menu
@@ -397,6 +482,38 @@ class MainWindow(gtk.Window):
         m_dict.connect('activate', self.call_dict)
         filemenu.append(m_dict)
 
+        m_file = gtk.MenuItem('_Translate file...')
+        key, mod = gtk.accelerator_parse('<Control>O')
+        m_file.add_accelerator('activate', agr, key, mod, gtk.ACCEL_VISIBLE)
+        m_file.connect('activate', self.translate_document)
+        filemenu.append(m_file)
+
+        m_import = gtk.MenuItem('_Import memory...')
+        m_import.connect('activate', self.import_memory)
+        filemenu.append(m_import)
+
+        m_export = gtk.MenuItem('_Export memory...')
+        m_export.connect('activate', self.export_memory)
+        filemenu.append(m_export)
+
+        m_matches = gtk.MenuItem('Memory _matches...')
+        key, mod = gtk.accelerator_parse('<Control>M')
+        m_matches.add_accelerator('activate', agr, key, mod, gtk.ACCEL_VISIBLE)
+        m_matches.connect('activate', self.show_matches)
+        filemenu.append(m_matches)
+
+        m_retry = gtk.MenuItem('_Retry failed lines')
+        key, mod = gtk.accelerator_parse('<Control>R')
+        m_retry.add_accelerator('activate', agr, key, mod, gtk.ACCEL_VISIBLE)
+        m_retry.connect('activate', self.retry_failed)
+        filemenu.append(m_retry)
+
+        m_cancel = gtk.ImageMenuItem(gtk.STOCK_CANCEL, agr)
+        key, mod = gtk.accelerator_parse('Escape')
+        m_cancel.add_accelerator('activate', agr, key, mod, gtk.ACCEL_VISIBLE)
+        m_cancel.connect('activate', self.cancel)
+        filemenu.append(m_cancel)
+
 
         sep = gtk.SeparatorMenuItem()
         filemenu.append(sep)
@@ -422,6 +539,21 @@ class MainWindow(gtk.Window):
         self.m_toolbar.connect('activate', self.show_hide_toolbar)
         editmenu.append(self.m_toolbar)
 
+        self.m_cache_only = gtk.CheckMenuItem('_Translation memory only')
+        self.m_cache_only.set_active(self.cache_only)
+        self.m_cache_only.connect('activate', self.switch_cache_only)
+        editmenu.append(self.m_cache_only)
+
+        self.m_fuzzy = gtk.CheckMenuItem('Use _fuzzy memory matches')
+        self.m_fuzzy.set_active(bool(self.fuzzy))
+        self.m_fuzzy.connect('activate', self.switch_fuzzy)
+        editmenu.append(self.m_fuzzy)
+
+        self.m_live = gtk.CheckMenuItem('_Live translation')
+        self.m_live.set_active(self.live)
+        self.m_live.connect('activate', self.switch_live)
+        editmenu.append(self.m_live)
+
         m_api = gtk.ImageMenuItem('_Select API', agr)
         m_api.set_image(image_4)
         key, mod = gtk.accelerator_parse('<Control>S')
@@ -434,6 +566,10 @@ class MainWindow(gtk.Window):
         aboutm = gtk.MenuItem('_Help')
         aboutm.set_submenu(aboutmenu)
 
+        m_stats = gtk.MenuItem('Request _statistics')
+        m_stats.connect('activate', self.show_stats)
+        aboutmenu.append(m_stats)
+
         m_about = gtk.ImageMenuItem('_About', agr)
         m_about.set_image(image_2)
         key, mod = gtk.accelerator_parse('<Control>B')
@@ -448,165 +584,141 @@ class MainWindow(gtk.Window):
         menubar.append(aboutm)
         # end text menu *******************************************************
 
-        # left up
-        textview1 = gtk.TextView()
-        l_u_scroll = gtk.ScrolledWindow()
-        l_u_scroll.add(textview1)
-        l_u_scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
-        textview1.set_wrap_mode(gtk.WRAP_WORD)
-        textview1.set_border_width(5)
-        textview1.set_left_margin(3)
-        textview1.set_right_margin(3)
-        self.l_u_buffer = textview1.get_buffer()
-
-        # left down
-        textview2 = gtk.TextView()
-        l_d_scroll = gtk.ScrolledWindow()
-        l_d_scroll.add(textview2)
-        l_d_scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
-        textview2.set_wrap_mode(gtk.WRAP_WORD)
-        textview2.set_border_width(5)
-        textview2.set_left_margin(3)
-        textview2.set_right_margin(3)
-        textview2.set_editable(False)
-        self.l_d_buffer = textview2.get_buffer()
-
-        # right up
-        textview3 = gtk.TextView()
-        r_u_scroll = gtk.ScrolledWindow()
-        r_u_scroll.add(textview3)
-        r_u_scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
-        textview3.set_wrap_mode(gtk.WRAP_WORD)
-        textview3.set_border_width(5)
-        textview3.set_left_margin(3)
-        textview3.set_right_margin(3)
-        self.r_u_buffer = textview3.get_buffer()
-
-        # right down
-        textview4 = gtk.TextView()
-        r_d_scroll = gtk.ScrolledWindow()
-        r_d_scroll.add(textview4)
-        r_d_scroll.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
-        textview4.set_wrap_mode(gtk.WRAP_WORD)
-        textview4.set_border_width(5)
-        textview4.set_left_margin(3)
-        textview4.set_right_margin(3)
-        textview4.set_editable(False)
-        self.r_d_buffer = textview4.get_buffer()
-
-        # images for buttons
-        img = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'clear-16x16.png'))
-        img2 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'translate-16x16.png'))
-
-        self.l_button = gtk.Button()
-        image = gtk.Image()
-        image.set_from_pixbuf(img2)
-        layout = gtk.HBox(False, 3)
-        layout.pack_start(image, False, False)
-        layout.pack_start(gtk.Label('Translate'), False, False)
-        alg = gtk.Alignment(0.5, 0.5)
-        alg.add(layout)
-        self.l_button.add(alg)
-        self.l_button.set_name('Left Button')
-        self.l_button.connect('clicked', self.translate)
+        # left pane, and the right one unless hidden: it is built when shown
+        (vbox_l, self.left_label, self.l_u_buffer, self.l_d_buffer,
+         self.l_button) = self.create_pane('Left Button', self.from_lang, self.to_lang)
+        self.vbox_r = self.right_label = self.r_u_buffer = self.r_d_buffer = self.r_button = None
 
+        self.panes = gtk.HBox(True, 20)
+        self.panes.pack_start(vbox_l)
+        if not self.one_direction:
+            self.create_right_pane()
 
-        self.r_button = gtk.Button()
-        image = gtk.Image()
-        image.set_from_pixbuf(img2)
-        layout = gtk.HBox(False, 3)
-        layout.pack_start(image, False, False)
-        layout.pack_start(gtk.Label('Translate'), False, False)
-        alg = gtk.Alignment(0.5, 0.5)
-        alg.add(layout)
-        self.r_button.add(alg)
-        self.r_button.set_name('Right Button')
-        self.r_button.connect('clicked', self.translate)
+        self.statusbar = gtk.Statusbar()
+        self.progressbar = gtk.ProgressBar()
+        cancel_button = gtk.Button(stock=gtk.STOCK_CANCEL)
+        cancel_button.connect('clicked', self.cancel)
+        self.progress_box = gtk.HBox(False, 3)
+        self.progress_box.pack_start(self.progressbar, True, True)
+        self.progress_box.pack_start(cancel_button, False, False)
+        if self.api_for_use=='Google':
+            api_label = 'G'
+        elif self.api_for_use=='Microsoft':
+            api_label = 'M'
+        elif self.api_for_use=='Auto':
+            api_label = 'A'
+        self.api_label = gtk.Label(api_label)
+
+        main_statusbar = gtk.HBox(False, 3)
+        main_statusbar.pack_start(self.api_label, False, False)
+        main_statusbar.pack_start(gtk.VSeparator(), False, False)
+        main_statusbar.pack_start(self.statusbar, True, True)
 
-        self.l_button_clear = gtk.Button()
-        image = gtk.Image()
-        image.set_from_pixbuf(img)
+        self.vbox = gtk.VBox()
+        self.vbox.pack_start(menubar, False, True)
+        self.vbox.pack_start(gtk.HSeparator(), False, True)
+        self.vbox.pack_start(self.panes)
+        self.vbox.pack_start(main_statusbar, False, True)
+        self.vbox.pack_end(self.progress_box, False, False)
+        # built when shown
+        self.toolbar = None
+        if not self.hide_toolbar:
+            self.create_toolbar()
+
+        self.add(self.vbox)
+
+        self.connect('destroy', self.pr_exit)
+        self.show_all()
+        self.progress_box.hide()
+
+
+    def create_pane(self, name, from_lang, to_lang):
+        ''' Text views and buttons of one direction of translation.
+        Returns (box, label, input buffer, output buffer, translate button) '''
+        # input
+        textview_in = gtk.TextView()
+        scroll_in = gtk.ScrolledWindow()
+        scroll_in.add(textview_in)
+        scroll_in.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        textview_in.set_wrap_mode(gtk.WRAP_WORD)
+        textview_in.set_border_width(5)
+        textview_in.set_left_margin(3)
+        textview_in.set_right_margin(3)
+        in_buffer = textview_in.get_buffer()
+
+        # output
+        textview_out = gtk.TextView()
+        scroll_out = gtk.ScrolledWindow()
+        scroll_out.add(textview_out)
+        scroll_out.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        textview_out.set_wrap_mode(gtk.WRAP_WORD)
+        textview_out.set_border_width(5)
+        textview_out.set_left_margin(3)
+        textview_out.set_right_margin(3)
+        textview_out.set_editable(False)
+        out_buffer = textview_out.get_buffer()
+
+        button = gtk.Button()
         layout = gtk.HBox(False, 3)
-        layout.pack_start(image, False, False)
-        layout.pack_start(gtk.Label('Clear'), False, False)
+        layout.pack_start(image('translate-16x16.png'), False, False)
+        layout.pack_start(gtk.Label('Translate'), False, False)
         alg = gtk.Alignment(0.5, 0.5)
         alg.add(layout)
-        self.l_button_clear.add(alg)
-        self.l_button_clear.set_name('Left Button')
-        self.l_button_clear.connect('clicked', self.clear)
+        button.add(alg)
+        button.set_name(name)
+        button.connect('clicked', self.translate)
 
-        self.r_button_clear = gtk.Button()
-        image = gtk.Image()
-        image.set_from_pixbuf(img)
+        button_clear = gtk.Button()
         layout = gtk.HBox(False, 3)
-        layout.pack_start(image, False, False)
+        layout.pack_start(image('clear-16x16.png'), False, False)
         layout.pack_start(gtk.Label('Clear'), False, False)
         alg = gtk.Alignment(0.5, 0.5)
         alg.add(layout)
-        self.r_button_clear.add(alg)
-        self.r_button_clear.set_name('Right Button')
-        self.r_button_clear.connect('clicked', self.clear)
+        button_clear.add(alg)
+        button_clear.set_name(name)
+        button_clear.connect('clicked', self.clear)
 
-        textview1.connect('key-press-event', self.keypressed, self.l_button)
-        textview3.connect('key-press-event', self.keypressed, self.r_button)
+        textview_in.connect('key-press-event', self.keypressed, button)
+        in_buffer.connect('changed', self.input_changed, button)
 
-        table_l = gtk.Table(1, 3, True)
-        table_l.set_border_width(10)
-        table_r = gtk.Table(1, 3, True)
-        table_r.set_border_width(10)
+        table = gtk.Table(1, 3, True)
+        table.set_border_width(10)
+        table.attach(button_clear, 0, 1, 0, 1)
+        table.attach(button, 1, 3, 0, 1)
 
-        table_l.attach(self.l_button_clear, 0, 1, 0, 1)
-        table_l.attach(self.l_button, 1, 3, 0, 1)
+        label = gtk.Label('<small>From <b>' + from_lang + '</b> to <b>' + to_lang + '</b></small>')
+        label.set_use_markup(True)
 
-        table_r.attach(self.r_button_clear, 0, 1, 0, 1)
-        table_r.attach(self.r_button, 1, 3, 0, 1)
+        vbox = gtk.VBox()
+        vbox.pack_start(label, False, False, 5)
+        vbox.pack_start(scroll_in)
+        vbox.pack_start(table, False, False)
+        vbox.pack_start(scroll_out)
+        return vbox, label, in_buffer, out_buffer, button
 
-        self.left_label = gtk.Label('<small>From <b>' + self.from_lang + '</b> to <b>' + self.to_lang + '</b></small>')
-        self.right_label = gtk.Label('<small>From <b>' + self.to_lang + '</b> to <b>' + self.from_lang + '</b></small>')
-        self.left_label.set_use_markup(True)
-        self.right_label.set_use_markup(True)
 
-        vbox_l = gtk.VBox()
-        self.vbox_r = gtk.VBox()
+    def create_right_pane(self):
+        ''' Build the pane of the reverse direction, on first showing '''
+        (self.vbox_r, self.right_label, self.r_u_buffer, self.r_d_buffer,
+         self.r_button) = self.create_pane('Right Button', self.to_lang, self.from_lang)
+        self.panes.pack_start(self.vbox_r)
+        self.vbox_r.show_all()
 
-        vbox_l.pack_start(self.left_label, False, False, 5)
-        vbox_l.pack_start(l_u_scroll)
-        vbox_l.pack_start(table_l, False, False)
-        vbox_l.pack_start(l_d_scroll)
-        self.vbox_r.pack_start(self.right_label, False, False, 5)
-        self.vbox_r.pack_start(r_u_scroll)
-        self.vbox_r.pack_start(table_r, False, False)
-        self.vbox_r.pack_start(r_d_scroll)
 
+    def create_toolbar(self):
+        ''' Build the toolbar, on first showing '''
         self.toolbar = gtk.Toolbar()
         self.toolbar.set_style(gtk.TOOLBAR_BOTH)
 
-        img1 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'language-32x32.png'))
-        image1 = gtk.Image()
-        image1.set_from_pixbuf(img1)
-        img2 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'about-32x32.png'))
-        image2 = gtk.Image()
-        image2.set_from_pixbuf(img2)
-        img3 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'exit-32x32.png'))
-        image3 = gtk.Image()
-        image3.set_from_pixbuf(img3)
-        img4 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'dictionary-32x32.png'))
-        image4 = gtk.Image()
-        image4.set_from_pixbuf(img4)
-        img5 = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'api-32x32.png'))
-        image5 = gtk.Image()
-        image5.set_from_pixbuf(img5)        
-
-
-        add_btn = gtk.ToolButton(image1, 'Language')
+        add_btn = gtk.ToolButton(image('language-32x32.png'), 'Language')
         add_btn.connect('clicked', self.choice_lang)
-        dict_btn = gtk.ToolButton(image4, 'Dictionary')
+        dict_btn = gtk.ToolButton(image('dictionary-32x32.png'), 'Dictionary')
         dict_btn.connect('clicked', self.call_dict)
-        api_btn = gtk.ToolButton(image5, 'Select API')
-        api_btn.connect('clicked', self.select_api)        
-        about_btn = gtk.ToolButton(image2, 'About')
+        api_btn = gtk.ToolButton(image('api-32x32.png'), 'Select API')
+        api_btn.connect('clicked', self.select_api)
+        about_btn = gtk.ToolButton(image('about-32x32.png'), 'About')
         about_btn.connect('clicked', self.about)
-        exit_btn = gtk.ToolButton(image3, 'Exit')
+        exit_btn = gtk.ToolButton(image('exit-32x32.png'), 'Exit')
         exit_btn.connect('clicked', self.pr_exit)
 
         self.toolbar.insert(add_btn, 0)
@@ -615,40 +727,54 @@ class MainWindow(gtk.Window):
         self.toolbar.insert(about_btn, 3)
         self.toolbar.insert(exit_btn, -1)
 
-        hbox = gtk.HBox(True, 20)
-        hbox.pack_start(vbox_l)
-        hbox.pack_start(self.vbox_r)
-
-        self.statusbar = gtk.Statusbar()
-        self.progressbar = gtk.ProgressBar()
-        if self.api_for_use=='Google':
-            api_label = 'G'
-        elif self.api_for_use=='Microsoft':
-            api_label = 'M'
-        self.api_label = gtk.Label(api_label)
-
-        main_statusbar = gtk.HBox(False, 3)
-        main_statusbar.pack_start(self.api_label, False, False)
-        main_statusbar.pack_start(gtk.VSeparator(), False, False)
-        main_statusbar.pack_start(self.statusbar, True, True)
-
-        self.vbox = gtk.VBox()
-        self.vbox.pack_start(menubar, False, True)
+        # under the menu
         self.vbox.pack_start(self.toolbar, False, True)
-        self.vbox.pack_start(gtk.HSeparator(), False, True)
-        self.vbox.pack_start(hbox)
-        self.vbox.pack_start(main_statusbar, False, True)
-        self.vbox.pack_end(self.progressbar, False, False)
-
-        self.add(self.vbox)
-
-        self.connect('destroy', self.pr_exit)
-        self.show_all()
-        self.progressbar.hide()
-        if self.one_direction:
-            self.vbox_r.hide()
-        if self.hide_toolbar:
-            self.toolbar.hide()
+        self.vbox.reorder_child(self.toolbar, 1)
+        self.toolbar.show_all()
+
+
+    @property
+    def engine(self):
+        ''' Translation engine, created on the first translation, in
+        whichever thread needs it first '''
+        with self._engine_lock:
+            if self._engine is None:
+                self._engine = self.create_engine()
+                self._engine.cache_only = self.cache_only
+                self._engine.fuzzy = self.fuzzy
+            return self._engine
+
+
+    def create_engine(self):
+        ''' Translation engine with settings from config '''
+        get = lambda option: self.config.getint('Translator', option)
+        # every request, also of the dictionary, as JSON lines
+        if self.config.get('Translator', 'metrics_log'):
+            recorder.add_observer(JsonLinesExporter(self.config.get('Translator', 'metrics_log')))
+        # keep-alive connections shared by both panes
+        http = ConnectionPool(get('http_per_host'), get('http_idle_timeout'),
+                              get('request_timeout'))
+        # concurrency adapts up to the number of workers; 0 rps is no ceiling
+        google = AdaptiveLimiter(maximum=get('google_workers'), rps=self.config.getfloat('Translator', 'google_max_rps'))
+        microsoft = AdaptiveLimiter(maximum=get('microsoft_workers'), rps=self.config.getfloat('Translator', 'microsoft_max_rps'))
+        backends = [GoogleBackend(http, get('batch_max_lines'), get('batch_max_chars'), google),
+                    MicrosoftBackend(http, get('batch_max_lines'), get('batch_max_chars'), microsoft)]
+        workers = {'Google': get('google_workers'),
+                   'Microsoft': get('microsoft_workers')}
+        # "Auto" picks the faster of both for every batch
+        workers['Auto'] = max(workers.values())
+        backends.append(HedgedBackend(backends[:], workers['Auto']))
+        memory = TranslationMemory(T_M_P, get('tm_max_entries'), get('tm_max_age_days'))
+        cache = SegmentCache(get('cache_max_bytes'))
+        engine = Engine(backends, workers, cache, memory)
+        engine.retries = get('retries')
+        return engine
+
+
+    def limits(self):
+        ''' Current concurrency limits of the translators, for tuning '''
+        return ', '.join('%s %s' % (name, self.engine.backends[name].limiter)
+                         for name in ('Google', 'Microsoft'))
 
 
     def call_dict(self, widget):
@@ -665,8 +791,11 @@ class MainWindow(gtk.Window):
             self.toolbar.hide()
             self.config.set('Translator', 'hide_toolbar', 'true')
         else:
-            # restore toolbar
-            self.toolbar.show()
+            # restore toolbar, built on first use
+            if self.toolbar is None:
+                self.create_toolbar()
+            else:
+                self.toolbar.show()
             self.config.set('Translator', 'hide_toolbar', 'false')
         with open(C_F_P, 'wb') as configfile:
             self.config.write(configfile)        
@@ -679,13 +808,49 @@ class MainWindow(gtk.Window):
             self.vbox_r.hide()
             self.config.set('Translator', 'one_direction', 'true')
         else:
-            # restore right textviews
-            self.vbox_r.show()
+            # restore right textviews, built on first use
+            if self.vbox_r is None:
+                self.create_right_pane()
+            else:
+                self.vbox_r.show()
             self.config.set('Translator', 'one_direction', 'false')
         with open(C_F_P, 'wb') as configfile:
             self.config.write(configfile)
             
 
+    def switch_cache_only(self, widget):
+        ''' Translate from translation memory only, without requests to server '''
+        with self._engine_lock:
+            self.cache_only = widget.get_active()
+            if self._engine is not None:
+                self._engine.cache_only = self.cache_only
+        self.config.set('Translator', 'cache_only', str(self.cache_only).lower())
+        with open(C_F_P, 'wb') as configfile:
+            self.config.write(configfile)
+
+
+    def switch_fuzzy(self, widget):
+        ''' Translate lines similar to ones in translation memory from memory '''
+        with self._engine_lock:
+            if widget.get_active():
+                self.fuzzy = self.fuzzy_threshold
+            else:
+                self.fuzzy = None
+            if self._engine is not None:
+                self._engine.fuzzy = self.fuzzy
+        self.config.set('Translator', 'fuzzy_translate', str(widget.get_active()).lower())
+        with open(C_F_P, 'wb') as configfile:
+            self.config.write(configfile)
+
+
+    def switch_live(self, widget):
+        ''' Translate while typing '''
+        self.live = widget.get_active()
+        self.config.set('Translator', 'live', str(self.live).lower())
+        with open(C_F_P, 'wb') as configfile:
+            self.config.write(configfile)
+
+
     def changed_select_api(self, widget, api_name=None):
         if widget.get_active():
             self.config.set('Translator', 'api', api_name)
@@ -696,6 +861,8 @@ class MainWindow(gtk.Window):
                 self.api_label.set_text('G')
             elif api_name=='Microsoft':
                 self.api_label.set_text('M')
+            elif api_name=='Auto':
+                self.api_label.set_text('A')
 
 
     def select_api(self, widget):
@@ -711,18 +878,23 @@ class MainWindow(gtk.Window):
         button_google.connect('toggled', self.changed_select_api, 'Google')
         button_microsoft = gtk.RadioButton(button_google, 'Microsoft')
         button_microsoft.connect('toggled', self.changed_select_api, 'Microsoft')
+        button_auto = gtk.RadioButton(button_google, 'Auto (fastest of both)')
+        button_auto.connect('toggled', self.changed_select_api, 'Auto')
         if self.api_for_use=='Google':
             button_google.set_active(True)
         elif self.api_for_use=='Microsoft':
             button_microsoft.set_active(True)
+        elif self.api_for_use=='Auto':
+            button_auto.set_active(True)
         my_vbox.pack_start(button_google, False, False)
         my_vbox.pack_start(button_microsoft, False, False)
+        my_vbox.pack_start(button_auto, False, False)
         my_vbox.show_all()
 
         dialog.vbox.pack_start(my_vbox)
         dialog.set_resizable(False)
         dialog.vbox.set_border_width(20)
-        dialog.set_icon_from_file(os.path.join(IMAGES_dir, 'api-32x32.png'))
+        dialog.set_icon(pixbuf('api-32x32.png'))
         response = dialog.run()
         dialog.destroy()
         if response == gtk.RESPONSE_OK:
@@ -742,9 +914,10 @@ class MainWindow(gtk.Window):
             combobox_2.set_active(keys.index(self.to_lang))
             # change labels
             self.left_label.set_text('<small>From <b>' + self.from_lang + '</b> to <b>' + self.to_lang + '</b></small>')
-            self.right_label.set_text('<small>From <b>' + self.to_lang + '</b> to <b>' + self.from_lang + '</b></small>')
             self.left_label.set_use_markup(True)
-            self.right_label.set_use_markup(True)
+            if self.right_label is not None:
+                self.right_label.set_text('<small>From <b>' + self.to_lang + '</b> to <b>' + self.from_lang + '</b></small>')
+                self.right_label.set_use_markup(True)
             # write selected language in config
             self.config.set('Translator', 'lang_from', self.from_lang)
             self.config.set('Translator', 'lang_to', self.to_lang)
@@ -775,10 +948,7 @@ class MainWindow(gtk.Window):
         combobox_2.set_active(keys.index(self.to_lang))
 
         button_swap = gtk.Button()
-        img = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'swap-16x16.png'))
-        image = gtk.Image()
-        image.set_from_pixbuf(img)
-        button_swap.add(image)
+        button_swap.add(image('swap-16x16.png'))
         button_swap.connect('clicked', swap_lang)
 
         fix.put(gtk.Label('From'), 10, 10)
@@ -793,17 +963,44 @@ class MainWindow(gtk.Window):
         dialog.vbox.pack_start(fix)
         dialog.set_resizable(False)
         dialog.vbox.set_border_width(20)
-        dialog.set_icon_from_file(os.path.join(IMAGES_dir, 'language-32x32.png'))
+        dialog.set_icon(pixbuf('language-32x32.png'))
         response = dialog.run()
         dialog.destroy()
         if response == gtk.RESPONSE_OK:
             change_lang(keys[combobox_1.get_active()], keys[combobox_2.get_active()])
 
+    def show_stats(self, widget):
+        ''' Show calls, errors and latency of every service, kept up to date '''
+        def refresh():
+            store.clear()
+            for backend, s in sorted(recorder.summary().items()):
+                store.append([backend, s['calls'], s['errors'],
+                              '%.0f' % (s['p50'] * 1000), '%.0f' % (s['p95'] * 1000),
+                              '%.0f' % (s['wait_p95'] * 1000),
+                              '%.1f / %.1f' % (s['bytes_out'] / 1024.0, s['bytes_in'] / 1024.0)])
+            return True
+
+        dialog = gtk.Dialog('Request statistics', self,
+                            gtk.DIALOG_DESTROY_WITH_PARENT,
+                            (gtk.STOCK_CLOSE, gtk.RESPONSE_CLOSE))
+        store = gtk.ListStore(str, int, int, str, str, str, str)
+        view = gtk.TreeView(store)
+        titles = ('Service', 'Calls', 'Errors', 'p50 ms', 'p95 ms', 'Wait p95 ms', 'KB out / in')
+        for column, title in enumerate(titles):
+            view.append_column(gtk.TreeViewColumn(title, gtk.CellRendererText(), text=column))
+        dialog.vbox.pack_start(view)
+        dialog.set_default_size(560, 160)
+        refresh()
+        timer = gobject.timeout_add(1000, refresh)
+        dialog.connect('response', lambda dialog, response: dialog.destroy())
+        dialog.connect('destroy', lambda dialog: gobject.source_remove(timer))
+        dialog.show_all()
+
+
     def about(self, widget):
         about = gtk.AboutDialog()
         about.set_program_name('Gnotran')
-        img = gtk.gdk.pixbuf_new_from_file(os.path.join(IMAGES_dir, 'gnotran-64x64.png'))
-        about.set_logo(img)
+        about.set_logo(pixbuf('gnotran-64x64.png'))
         about.set_version(__version__)
         about.set_copyright('Copyrights © 2010-2011 Nikolay Blohin')
         about.set_comments('Simple Gnome client for translators')
@@ -820,118 +1017,487 @@ class MainWindow(gtk.Window):
         about.set_artists(['Thanks for beautiful icons:',
                            '    Rick Vause http://rickvause.com',
                            '    Schollidesign http://schollidesign.deviantart.com'])
-        about.set_icon_from_file(os.path.join(IMAGES_dir, 'about-32x32.png'))
+        about.set_icon(pixbuf('about-32x32.png'))
         about.run()
         about.destroy()
 
 
     def translate(self, widget):
         ''' Translate text in tread'''
-        def request_to_server(self, text, out_buffer):
-            # show progressbar
-            gtk.gdk.threads_enter()
-            self.progressbar.show()
-            fraction = 0.2
-            self.progressbar.set_fraction(fraction)
-            gtk.gdk.threads_leave()
-
-            translation = ''
-            lines = text.split('\n')
-            step_fraction = (1-fraction)/len(lines)
-
-            if self.api_for_use=='Google':
-
-                for line in lines:
-                    url = 'http://ajax.googleapis.com/ajax/services/language/translate?v=1.0&q=' + urllib.quote(line) + '&langpair=' + c_from + '|' + c_to
-
-                    try:
-                        server_response = urllib.urlopen(url)
-                        response_dict = json.load(server_response)
-                    except:
-                        response_dict = False
-
-                    gtk.gdk.threads_enter()
+        def request_to_server(self, text, out_buffer, job):
+            # widget updates run on the main loop, merged once per frame;
+            # they check the job there, so a cancelled job never writes
+            # to the buffer
+            def set_fraction(fraction):
+                if not job.cancelled():
                     self.progressbar.set_fraction(fraction)
-                    fraction += step_fraction
-                    gtk.gdk.threads_leave()
-
-                    if response_dict:
-                        if response_dict['responseStatus'] == 200:
-                            translation += response_dict['responseData']['translatedText'] + '\n'
-                        else:
-                            translation += '\n'
-                        message = 'Translated successfully completed.'
-                    else:
-                        translation = ''
-                        message = 'Translation Error (error connecting to Google). Try again later.'
-                        break
-                    
-            elif self.api_for_use== 'Microsoft':
-
-                for line in lines:
-                    if line=='':
-                        line = ' '
-                    url_part_1 = 'http://api.microsofttranslator.com/V2/Ajax.svc/GetTranslations?oncomplete=mycallback&appId=18148BBCC187B05F6D0B99CD249C60A833E67944&text='
-                    url_part_2 = '&from=%s&to=%s&maxTranslations=5' % (c_from, c_to)
-                    url = url_part_1 + urllib.quote(line) + url_part_2
-
-                    try:
-                        server_response = urllib.urlopen(url)
-                        s = server_response.read()
-                        s = s[14:]
-                        s = s.rstrip(');')
-                        response_dict = json.loads(s)                        
-                    except:
-                        response_dict = False
-
-                    gtk.gdk.threads_enter()
-                    self.progressbar.set_fraction(fraction)
-                    fraction += step_fraction
-                    gtk.gdk.threads_leave()
-
-                    if response_dict:
-                        translation += response_dict['Translations'][0]['TranslatedText'] + '\n'
-                        message = 'Translated successfully completed.'
-                    else:
-                        translation = ''
-                        message = 'Translation Error (error connecting to Microsoft). Try again later.'
-                        break
-
-            gtk.gdk.threads_enter()
-            translation = translation.replace('&#39;', '\'')
-            translation = translation.replace('&quot;', '\"')
-            translation = translation.strip()
-            out_buffer.set_text(translation)
-            self.progressbar.hide()
-            self.statusbar.pop(bar_id)
-            self.statusbar.push(bar_id, message)
-            gtk.gdk.threads_leave()
+
+            def progress(done, total):
+                updates.set((job, 'progress'), set_fraction,
+                            fraction + (1 - fraction) * done / total)
+
+            def insert(texts):
+                if not job.cancelled():
+                    out_buffer.insert(out_buffer.get_end_iter(), ''.join(texts))
+
+            def show_lines(start, translations):
+                # append translated lines as soon as they are ready
+                text = '\n'.join(translations)
+                if start:
+                    text = '\n' + text
+                updates.extend((job, 'text'), insert, text)
+
+            def finished(message, snapshot):
+                # a newer job of this pane owns the widgets now
+                if self.jobs.get(pane) is job:
+                    del self.jobs[pane]
+                    if snapshot:
+                        self.snapshots[pane] = snapshot
+                    if not self.jobs:
+                        self.progress_box.hide()
+                    self.statusbar.pop(bar_id)
+                    self.statusbar.push(bar_id, message)
+
+            lines = text.decode('utf-8').split('\n')
+            message, snapshot = 'Translation Error.', None
+            try:
+                translations, stats = self.engine.translate(self.api_for_use, lines,
+                                                            c_from, c_to, progress,
+                                                            show_lines, job)
+                snapshot = ((self.api_for_use, c_from, c_to), lines, translations,
+                            set(stats.failed))
+                if stats.failed:
+                    message = self.failed_message(stats)
+                else:
+                    message = 'Translated successfully completed: %s. Cache: %s. Memory: %d hits, %d misses. Limit: %s.' % (
+                        stats, self.engine.cache, self.engine.memory.hits, self.engine.memory.misses,
+                        self.limits())
+            except Cancelled:
+                message = 'Translation cancelled.'
+            except Exception, e:
+                # e.g. the memory database, the job must end all the same
+                message = 'Translation Error (%s).' % e
+            finally:
+                updates.put(finished, message, snapshot)
 
 
         bar_id = self.statusbar.get_context_id('statusbar')
-        if self.api_for_use=='Google':
+        if self.cache_only:
+            mess = 'Looking up translation memory...'
+        elif self.api_for_use=='Google':
             mess = 'Request to Google...'
         elif self.api_for_use=='Microsoft':
             mess = 'Request to Microsoft...'
+        elif self.api_for_use=='Auto':
+            mess = 'Request to Google and Microsoft...'
         self.statusbar.push(bar_id, mess)
 
-        if widget.get_name() == 'Left Button':
-            in_buffer = self.l_u_buffer
-            out_buffer = self.l_d_buffer
-            c_from = self.all_lang[self.from_lang]
-            c_to = self.all_lang[self.to_lang]
+        pane = widget.get_name()
+        in_buffer, out_buffer, c_from, c_to = self.pane_buffers(pane)
+
+        text = in_buffer.get_text(in_buffer.get_start_iter(), in_buffer.get_end_iter())
+        out_buffer.set_text('')
+        self.snapshots.pop(pane, None)
+        job = self.new_job(pane)
+
+        # show progressbar
+        self.progress_box.show()
+        fraction = 0.2
+        self.progressbar.set_fraction(fraction)
+
+        mythread = threading.Thread(target=profiled('translate', request_to_server), args=(self, text, out_buffer, job))
+        mythread.start()
+
+
+    def translate_document(self, widget):
+        ''' Translate a whole file into another one, resumable '''
+        def request_to_server(self, source, target, job):
+            def set_fraction(fraction):
+                if not job.cancelled():
+                    self.progressbar.set_fraction(fraction)
+
+            def progress(done, total):
+                updates.set((job, 'progress'), set_fraction, float(done) / total)
+
+            def finished(message):
+                if self.jobs.get('File') is job:
+                    del self.jobs['File']
+                    if not self.jobs:
+                        self.progress_box.hide()
+                    self.statusbar.pop(bar_id)
+                    self.statusbar.push(bar_id, message)
+
+            message = 'Translation Error.'
+            try:
+                resumed, stats = translate_file(self.engine, self.api_for_use, source, target,
+                                                c_from, c_to, progress=progress, job=job)
+                message = 'File translated: %s.' % stats
+                if resumed:
+                    message += ' Resumed after line %d.' % resumed
+                if stats.failed:
+                    message += ' %d lines not translated.' % len(stats.failed)
+            except Cancelled:
+                message = 'Translation cancelled, it goes on from there next time.'
+            except (EnvironmentError, ValueError), e:
+                # unreadable files, or not utf-8
+                message = 'File Error (%s).' % e
+            except Exception, e:
+                message = 'Translation Error (%s).' % e
+            finally:
+                updates.put(finished, message)
+
+
+        dialog = gtk.FileChooserDialog('Translate file', self, gtk.FILE_CHOOSER_ACTION_OPEN,
+                                       (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                                        gtk.STOCK_OPEN, gtk.RESPONSE_OK))
+        if dialog.run() == gtk.RESPONSE_OK:
+            source = dialog.get_filename()
         else:
-            in_buffer = self.r_u_buffer
-            out_buffer = self.r_d_buffer
-            c_from = self.all_lang[self.to_lang]
-            c_to = self.all_lang[self.from_lang]
+            source = None
+        dialog.destroy()
+        if not source:
+            return
+
+        c_from, c_to = self.all_lang[self.from_lang], self.all_lang[self.to_lang]
+        dialog = gtk.FileChooserDialog('Save translation as', self, gtk.FILE_CHOOSER_ACTION_SAVE,
+                                       (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                                        gtk.STOCK_SAVE, gtk.RESPONSE_OK))
+        dialog.set_current_folder(os.path.dirname(source))
+        dialog.set_current_name('%s.%s' % (os.path.basename(source), c_to))
+        if dialog.run() == gtk.RESPONSE_OK:
+            target = dialog.get_filename()
+        else:
+            target = None
+        dialog.destroy()
+        if not target:
+            return
+
+        bar_id = self.statusbar.get_context_id('statusbar')
+        if os.path.exists(checkpoint_path(target)):
+            mess = 'Resuming translation of %s...' % os.path.basename(source)
+        else:
+            mess = 'Translating %s...' % os.path.basename(source)
+        self.statusbar.push(bar_id, mess)
+        self.progress_box.show()
+        self.progressbar.set_fraction(0)
+        job = self.new_job('File')
+        mythread = threading.Thread(target=profiled('document', request_to_server), args=(self, source, target, job))
+        mythread.start()
+
+
+    def import_memory(self, widget):
+        ''' Load a TMX or TSV file into translation memory '''
+        dialog = gtk.FileChooserDialog('Import translation memory', self, gtk.FILE_CHOOSER_ACTION_OPEN,
+                                       (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                                        gtk.STOCK_OPEN, gtk.RESPONSE_OK))
+        self.transfer_memory(dialog, import_file, 'Importing')
+
 
+    def export_memory(self, widget):
+        ''' Save translation memory as a TMX or TSV file '''
+        dialog = gtk.FileChooserDialog('Export translation memory', self, gtk.FILE_CHOOSER_ACTION_SAVE,
+                                       (gtk.STOCK_CANCEL, gtk.RESPONSE_CANCEL,
+                                        gtk.STOCK_SAVE, gtk.RESPONSE_OK))
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name('gnotran-memory.tmx')
+        self.transfer_memory(dialog, export_file, 'Exporting')
+
+
+    def transfer_memory(self, dialog, function, doing):
+        ''' Run import_file or export_file with a file from dialog: TMX
+        files hold all language pairs, TSV files the left pane's one '''
+        def request_to_server(self, path, pairs):
+            def set_fraction(fraction):
+                self.progressbar.set_fraction(fraction)
+
+            def progress(done, total):
+                updates.set((path, 'progress'), set_fraction, float(done) / max(total, 1))
+
+            def finished(message):
+                self.jobs.pop(path, None)
+                if not self.jobs:
+                    self.progress_box.hide()
+                self.statusbar.pop(bar_id)
+                self.statusbar.push(bar_id, message)
+
+            message = 'File Error.'
+            try:
+                if function is import_file:
+                    message = 'Imported %s.' % function(self.engine.memory, path, pairs, progress)
+                else:
+                    message = 'Exported %s.' % function(self.engine.memory, path, pairs)
+            except (EnvironmentError, SyntaxError, ValueError), e:
+                # SyntaxError: malformed XML
+                message = 'File Error (%s).' % e
+            except Exception, e:
+                message = 'Translation memory Error (%s).' % e
+            finally:
+                updates.put(finished, message)
+
+
+        filters = (('Translation memory (*.tmx, *.tsv)', ('*.tmx', '*.tsv')),
+                   ('TMX (*.tmx)', ('*.tmx',)),
+                   ('Tab-separated (*.tsv)', ('*.tsv',)))
+        for name, patterns in filters:
+            file_filter = gtk.FileFilter()
+            file_filter.set_name(name)
+            for pattern in patterns:
+                file_filter.add_pattern(pattern)
+            dialog.add_filter(file_filter)
+        if dialog.run() == gtk.RESPONSE_OK:
+            path = dialog.get_filename()
+        else:
+            path = None
+        dialog.destroy()
+        if not path:
+            return
+
+        pairs = None
+        if not path.lower().endswith('.tmx'):
+            pairs = [(self.all_lang[self.from_lang], self.all_lang[self.to_lang])]
+        bar_id = self.statusbar.get_context_id('statusbar')
+        self.statusbar.push(bar_id, '%s %s...' % (doing, os.path.basename(path)))
+        self.progress_box.show()
+        self.progressbar.set_fraction(0)
+        # not cancellable, but keeps the progressbar up
+        self.jobs[path] = Job()
+        mythread = threading.Thread(target=profiled('transfer', request_to_server), args=(self, path, pairs))
+        mythread.start()
+
+
+    def pane_buffers(self, pane):
+        ''' Input and output buffers and language codes of a pane '''
+        if pane == 'Left Button':
+            return (self.l_u_buffer, self.l_d_buffer,
+                    self.all_lang[self.from_lang], self.all_lang[self.to_lang])
+        else:
+            return (self.r_u_buffer, self.r_d_buffer,
+                    self.all_lang[self.to_lang], self.all_lang[self.from_lang])
+
+
+    def new_job(self, pane):
+        ''' Job for a new translation of the pane, superseding the running one '''
+        if pane in self.jobs:
+            self.jobs[pane].cancel()
+        job = Job()
+        self.jobs[pane] = job
+        return job
+
+
+    def input_changed(self, in_buffer, button):
+        ''' Restart live translation timer when text is edited '''
+        if not self.live:
+            return
+        pane = button.get_name()
+        if pane in self.live_timers:
+            gobject.source_remove(self.live_timers[pane])
+        self.live_timers[pane] = gobject.timeout_add(LIVE_DELAY, self.live_translate, button)
+
+
+    def live_translate(self, button):
+        ''' Translate only the lines changed since the last translation '''
+        def request_to_server(self, changed, job):
+            translations = stats = None
+            message = 'Translation Error.'
+            try:
+                translations, stats = self.engine.translate(self.api_for_use, changed,
+                                                            c_from, c_to, job=job)
+                if stats.failed:
+                    message = self.failed_message(stats)
+                else:
+                    message = 'Live translation: %s.' % stats
+            except Cancelled:
+                # the output still matches the snapshot
+                message = 'Translation cancelled.'
+            except Exception, e:
+                translations = None
+                message = 'Translation Error (%s).' % e
+            finally:
+                updates.put(finished, message, translations, stats)
+
+        def finished(message, translations, stats):
+            if self.jobs.get(pane) is job:
+                del self.jobs[pane]
+                if translations is not None:
+                    new_output = list(output)
+                    # patch from the end, so earlier line numbers stay valid
+                    for (tag, i1, i2, j1, j2), offset in reversed(zip(opcodes, offsets)):
+                        new_lines = translations[offset:offset + j2 - j1]
+                        replace_lines(out_buffer, i1, i2, new_lines)
+                        new_output[i1:i2] = new_lines
+                    # failed lines: unchanged ones moved, and new ones
+                    new_failed = set(changed_at[k] for k in stats.failed)
+                    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                        if tag == 'equal':
+                            new_failed.update(j1 + i - i1 for i in failed if i1 <= i < i2)
+                    self.snapshots[pane] = (key, lines, new_output, new_failed)
+                self.statusbar.pop(bar_id)
+                self.statusbar.push(bar_id, message)
+
+
+        pane = button.get_name()
+        self.live_timers.pop(pane, None)
+        in_buffer, out_buffer, c_from, c_to = self.pane_buffers(pane)
+        key = (self.api_for_use, c_from, c_to)
         text = in_buffer.get_text(in_buffer.get_start_iter(), in_buffer.get_end_iter())
+        lines = text.decode('utf-8').split('\n')
+
+        snapshot = self.snapshots.get(pane)
+        if snapshot is None or snapshot[0] != key:
+            if text.strip():
+                self.translate(button)
+            return False
+        source, output, failed = snapshot[1:]
+
+        matcher = difflib.SequenceMatcher(None, source, lines, autojunk=False)
+        opcodes = [op for op in matcher.get_opcodes() if op[0] != 'equal']
+        if not opcodes:
+            return False
+        # changed lines, their line numbers and where the lines of every
+        # opcode start among them
+        changed = []
+        changed_at = []
+        offsets = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            offsets.append(len(changed))
+            changed.extend(lines[j1:j2])
+            changed_at.extend(range(j1, j2))
 
-        mythread = threading.Thread(target=request_to_server, args=(self, text, out_buffer))
+        bar_id = self.statusbar.get_context_id('statusbar')
+        job = self.new_job(pane)
+        mythread = threading.Thread(target=profiled('live', request_to_server), args=(self, changed, job))
+        mythread.start()
+        return False
+
+
+    def show_matches(self, widget):
+        ''' Offer translations of similar lines from memory for the line
+        at the cursor '''
+        def request_to_server(self, line):
+            # the first lookup builds the index, which takes a while
+            found = self.engine.memory.fuzzy_many(c_from, c_to, [line], self.fuzzy_threshold, 5)
+            updates.put(choose, line, found.get(line, []))
+
+        def choose(line, matches):
+            self.statusbar.pop(bar_id)
+            if not matches:
+                self.statusbar.push(bar_id, 'No similar lines in translation memory.')
+                return
+            # not modal: a nested main loop would run later updates first
+            dialog = gtk.Dialog('Memory matches', self,
+                                gtk.DIALOG_DESTROY_WITH_PARENT,
+                                (gtk.STOCK_CANCEL, gtk.RESPONSE_REJECT,
+                                 gtk.STOCK_OK, gtk.RESPONSE_OK))
+            store = gtk.ListStore(str, str, str)
+            for score, source, target in matches:
+                store.append(['%d%%' % (score * 100), source.encode('utf-8'),
+                              adapt(line, source, target).encode('utf-8')])
+            view = gtk.TreeView(store)
+            for column, title in enumerate(('Similarity', 'Source', 'Translation')):
+                view.append_column(gtk.TreeViewColumn(title, gtk.CellRendererText(), text=column))
+            view.get_selection().select_path(0)
+            view.connect('row-activated', lambda *args: dialog.response(gtk.RESPONSE_OK))
+            dialog.vbox.pack_start(view)
+            dialog.set_default_size(500, 200)
+            dialog.connect('response', chosen, view)
+            dialog.show_all()
+
+        def chosen(dialog, response, view):
+            model, selected = view.get_selection().get_selected()
+            if response == gtk.RESPONSE_OK and selected is not None:
+                out_buffer = self.pane_buffers(pane)[1]
+                while out_buffer.get_line_count() <= number:
+                    out_buffer.insert(out_buffer.get_end_iter(), '\n')
+                translation = model.get_value(selected, 2)
+                replace_lines(out_buffer, number, number + 1, [translation])
+                snapshot = self.snapshots.get(pane)
+                if snapshot and number < len(snapshot[2]):
+                    snapshot[2][number] = translation.decode('utf-8')
+                    snapshot[3].discard(number)
+            dialog.destroy()
+
+
+        # the pane with the keyboard focus, left by default
+        pane = 'Left Button'
+        focus = self.get_focus()
+        if isinstance(focus, gtk.TextView) and focus.get_buffer() in (self.r_u_buffer, self.r_d_buffer):
+            pane = 'Right Button'
+        in_buffer, out_buffer, c_from, c_to = self.pane_buffers(pane)
+        number = in_buffer.get_iter_at_mark(in_buffer.get_insert()).get_line()
+        start = in_buffer.get_iter_at_line(number)
+        end = start.copy()
+        if not end.ends_line():
+            end.forward_to_line_end()
+        line = in_buffer.get_text(start, end).decode('utf-8')
+        if not line.strip():
+            return
+
+        bar_id = self.statusbar.get_context_id('statusbar')
+        self.statusbar.push(bar_id, 'Looking up translation memory...')
+        mythread = threading.Thread(target=profiled('matches', request_to_server), args=(self, line))
         mythread.start()
 
 
+    def failed_message(self, stats):
+        ''' Status message for a translation with failed lines '''
+        return ('Translation Error: %d lines not translated (error connecting to %s). '
+                'Use "Retry failed lines" to send them again.' % (len(stats.failed), self.api_for_use))
+
+
+    def retry_failed(self, widget):
+        ''' Translate again only the lines that failed last time '''
+        def request_to_server(self, pane, job, snapshot):
+            key, source, output, failed = snapshot
+            failed = sorted(failed)
+            translations = stats = None
+            message = 'Translation Error.'
+            try:
+                translations, stats = self.engine.translate(key[0], [source[i] for i in failed],
+                                                            key[1], key[2], job=job)
+            except Cancelled:
+                message = 'Translation cancelled.'
+            except Exception, e:
+                message = 'Translation Error (%s).' % e
+            finally:
+                updates.put(finished, pane, job, snapshot, failed, translations, stats, message)
+
+        def finished(pane, job, snapshot, failed, translations, stats, message):
+            key, source, output = snapshot[:3]
+            if self.jobs.get(pane) is not job:
+                return
+            del self.jobs[pane]
+            self.statusbar.pop(bar_id)
+            if translations is None:
+                self.statusbar.push(bar_id, message)
+            else:
+                out_buffer = self.pane_buffers(pane)[1]
+                new_output = list(output)
+                for i, translation in zip(failed, translations):
+                    replace_lines(out_buffer, i, i + 1, [translation])
+                    new_output[i] = translation
+                still_failed = set(failed[k] for k in stats.failed)
+                self.snapshots[pane] = (key, source, new_output, still_failed)
+                if stats.failed:
+                    self.statusbar.push(bar_id, self.failed_message(stats))
+                else:
+                    self.statusbar.push(bar_id, 'Failed lines translated: %s.' % stats)
+
+
+        bar_id = self.statusbar.get_context_id('statusbar')
+        for pane, snapshot in self.snapshots.items():
+            if not snapshot[3] or pane in self.jobs:
+                continue
+            job = self.new_job(pane)
+            mythread = threading.Thread(target=profiled('retry', request_to_server), args=(self, pane, job, snapshot))
+            mythread.start()
+
+
+    def cancel(self, widget):
+        ''' Cancel all running translations '''
+        for job in self.jobs.values():
+            job.cancel()
+
+
     def clear(self, widget):
         ''' Clear buffers '''
         if widget.get_name() == 'Left Button':
@@ -943,6 +1509,7 @@ class MainWindow(gtk.Window):
 
         in_buffer.set_text('')
         out_buffer.set_text('')
+        self.snapshots.pop(widget.get_name(), None)
 
 
     def keypressed(self, widget, event, button):
@@ -958,6 +1525,24 @@ class MainWindow(gtk.Window):
         gtk.main_quit()
 
 
-gtk.gdk.threads_init()
-MainWindow()
-gtk.main()
+def main():
+    parser = OptionParser(usage='python gnotran.py [--profile DIR]')
+    parser.add_option('--profile', default=None, metavar='DIR',
+                      help='write cProfile and memory reports of startup and requests to DIR')
+    options, args = parser.parse_args()
+    if options.profile:
+        profiling.enable(options.profile)
+
+    gobject.threads_init()
+    if profiling.enabled():
+        startup = Profile('startup')
+        startup.start()
+        MainWindow()
+        startup.stop()
+    else:
+        MainWindow()
+    gtk.main()
+
+
+if __name__ == '__main__':
+    main()
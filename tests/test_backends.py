@@ -0,0 +1,72 @@
+'''
+Tests of the translator backends.
+'''
+
+import json
+import unittest
+
+from translator import Engine, GoogleBackend, MicrosoftBackend, SegmentCache, TranslationError
+from translator.engine import FAILED_MARK
+
+
+class FakeHTTP(object):
+    ''' ConnectionPool answering every request with one body '''
+
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, url, backend=None, waited=0.0):
+        return self.body
+
+
+def google_answer(*answers):
+    return json.dumps({'responseData': [
+        {'responseStatus': status,
+         'responseData': {'translatedText': text} if status == 200 else None}
+        for text, status in answers]})
+
+
+def microsoft_answer(*answers):
+    return 'mycallback(%s);' % json.dumps(list(answers))
+
+
+class GoogleTest(unittest.TestCase):
+
+    def test_translations(self):
+        backend = GoogleBackend(FakeHTTP(google_answer((u'Hallo', 200), (u'Welt', 200))))
+        self.assertEqual(backend.request([u'hello', u'world'], 'en', 'de'), [u'Hallo', u'Welt'])
+
+    def test_error_status(self):
+        backend = GoogleBackend(FakeHTTP(google_answer((u'Hallo', 200), (None, 400))))
+        self.assertRaises(TranslationError, backend.request, [u'hello', u'world'], 'en', 'de')
+
+    def test_error_status_fails_lines(self):
+        backend = GoogleBackend(FakeHTTP(google_answer((u'Hallo', 200), (None, 400))))
+        engine = Engine([backend], {'Google': 1}, SegmentCache())
+        engine.retries = 0
+        translations, stats = engine.translate('Google', [u'hello', u'world'], 'en', 'de')
+        self.assertEqual(translations, [FAILED_MARK % u'hello', FAILED_MARK % u'world'])
+        self.assertEqual(stats.failed, [0, 1])
+
+
+class MicrosoftTest(unittest.TestCase):
+
+    def test_translations(self):
+        backend = MicrosoftBackend(FakeHTTP(microsoft_answer({'TranslatedText': u'Hallo'})))
+        self.assertEqual(backend.request([u'hello'], 'en', 'de'), [u'Hallo'])
+
+    def test_error_entry(self):
+        backend = MicrosoftBackend(FakeHTTP(microsoft_answer(
+            {'TranslatedText': u'Hallo'}, {'Error': 'ArgumentOutOfRangeException'})))
+        self.assertRaises(TranslationError, backend.request, [u'hello', u'world'], 'en', 'de')
+
+    def test_error_entry_fails_lines(self):
+        backend = MicrosoftBackend(FakeHTTP(microsoft_answer({'Error': 'ArgumentOutOfRangeException'})))
+        engine = Engine([backend], {'Microsoft': 1}, SegmentCache())
+        engine.retries = 0
+        self.assertEqual(list(engine.translate_stream('Microsoft', [u'hello'], 'en', 'de')),
+                         [FAILED_MARK % u'hello'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+'''
+Tests of batch statistics.
+'''
+
+import unittest
+
+from translator import BatchStats
+
+
+class MergeTest(unittest.TestCase):
+
+    def test_merge_served(self):
+        first = BatchStats()
+        first.add([u'cat', u'dog'], 'Google')
+        second = BatchStats()
+        second.add([u'bird'], 'Microsoft')
+        first.merge(second)
+        self.assertEqual(first.requests, 2)
+        self.assertEqual(first.served, {'Google': 2, 'Microsoft': 1})
+        self.assertEqual(first.served_by, {u'cat': 'Google', u'dog': 'Google',
+                                           u'bird': 'Microsoft'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+'''
+Tests of translation memory import and export.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from translator import TranslationMemory, import_file, export_file
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.memory = TranslationMemory(os.path.join(self.directory, 'memory.sqlite'),
+                                        max_entries=1000)
+
+    def tearDown(self):
+        self.memory.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def test_import_beyond_max_entries(self):
+        path = self.write('big.tsv', ['line %d\tZeile %d' % (i, i) for i in range(2500)])
+        stats = import_file(self.memory, path, [('en', 'de')])
+        self.assertEqual(stats.entries, 2500)
+        self.assertEqual(len(self.memory), 2500)
+        self.assertEqual(self.memory.get_many('Google', 'en', 'de', [u'line 2499']),
+                         {u'line 2499': u'Zeile 2499'})
+
+    def test_imported_entries_survive_eviction(self):
+        path = self.write('big.tsv', ['line %d\tZeile %d' % (i, i) for i in range(1500)])
+        import_file(self.memory, path, [('en', 'de')])
+        self.memory.put_many('Google', 'en', 'de',
+                             [(u'other %d' % i, u'andere %d' % i) for i in range(1200)])
+        self.memory.evict()
+        # only the translator's own entries are limited
+        self.assertEqual(len(self.memory), 1500 + 1000)
+
+    def test_duplicate_lines_counted_once(self):
+        path = self.write('dup.tsv', ['a\tx', 'b\ty', 'a\tz'])
+        stats = import_file(self.memory, path, [('en', 'de')])
+        self.assertEqual(stats.entries, 2)
+        self.assertEqual(len(self.memory), 2)
+        self.assertEqual(self.memory.get_many('Google', 'en', 'de', [u'a']), {u'a': u'z'})
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.memory = self.open_memory('memory.sqlite')
+        self.memory.put_many('Google', 'en', 'de', [(u'cat', u'Katze G'), (u'dog', u'Hund')])
+        self.memory.put_many('Microsoft', 'en', 'de', [(u'cat', u'Katze M')])
+        # the Google entry was used last
+        self.memory.get_many('Google', 'en', 'de', [u'cat'])
+
+    def tearDown(self):
+        self.memory.close()
+        shutil.rmtree(self.directory)
+
+    def open_memory(self, name):
+        return TranslationMemory(os.path.join(self.directory, name))
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def round_trip(self, extension):
+        first = os.path.join(self.directory, 'first.' + extension)
+        second = os.path.join(self.directory, 'second.' + extension)
+        stats = export_file(self.memory, first, [('en', 'de')])
+        self.assertEqual(stats.entries, 2)
+        copy = self.open_memory('copy.sqlite')
+        try:
+            import_file(copy, first, [('en', 'de')])
+            export_file(copy, second, [('en', 'de')])
+        finally:
+            copy.close()
+        self.assertEqual(self.read('first.' + extension), self.read('second.' + extension))
+
+    def test_tsv_one_row_per_line(self):
+        self.round_trip('tsv')
+        self.assertEqual(self.read('first.tsv'), 'cat\tKatze G\ndog\tHund\n')
+
+    def test_tmx_one_unit_per_line(self):
+        self.round_trip('tmx')
+        self.assertEqual(self.read('first.tmx').count('<tu>'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
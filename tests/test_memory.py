@@ -0,0 +1,68 @@
+'''
+Tests of the translation memory.
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from translator import TranslationMemory
+from translator import memory
+
+
+NAMES = ('cat', 'dog', 'cow', 'fox', 'owl', 'bat', 'rat', 'hen', 'pig', 'elk')
+
+class FuzzyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.memory = TranslationMemory(os.path.join(self.directory, 'memory.sqlite'))
+        self.memory.put_many('Google', 'en', 'de',
+                             [(u'the %s sat on the mat' % name, u'Katze %d' % i)
+                              for i, name in enumerate(NAMES)])
+        self.chunk = memory.INDEX_CHUNK
+        memory.INDEX_CHUNK = 3
+
+    def tearDown(self):
+        memory.INDEX_CHUNK = self.chunk
+        self.memory.close()
+        shutil.rmtree(self.directory)
+
+    def sources(self, line, threshold=0.8):
+        return [source for score, source, target in
+                self.memory.fuzzy_many('en', 'de', [line], threshold, limit=20).get(line, [])]
+
+    def test_index_built_in_chunks(self):
+        self.assertEqual(self.sources(u'the elk sat on the mat', 1.0), [u'the elk sat on the mat'])
+        # every line is 4 of 6 words like this one
+        self.assertEqual(len(self.sources(u'the ant sat on the mat', 0.6)), 10)
+
+    def test_new_entries_indexed(self):
+        self.sources(u'anything')
+        self.memory.put_many('Microsoft', 'en', 'de', [(u'a dog sat on mat', u'Hund')])
+        self.assertEqual(self.sources(u'a dog sat on mat'), [u'a dog sat on mat'])
+
+    def test_replaced_entry_keeps_its_id(self):
+        self.sources(u'anything')
+        self.memory.put_many('Google', 'en', 'de', [(u'the cat sat on the mat', u'neu')])
+        self.assertEqual(self.memory.fuzzy_many('en', 'de', [u'the cat sat on the mat'], 1.0),
+                         {u'the cat sat on the mat': [(1.0, u'the cat sat on the mat', u'neu')]})
+        self.assertEqual((self.memory._fuzzy.live, self.memory._fuzzy.removed), (10, 0))
+
+    def test_evicted_entries_leave_the_index(self):
+        self.sources(u'anything')
+        self.memory.max_entries = 8
+        self.memory.evict()
+        self.assertEqual((self.memory._fuzzy.live, self.memory._fuzzy.removed), (8, 2))
+        self.assertEqual(self.sources(u'the cat sat on the mat', 1.0), [])
+        # more removed than left: built anew on the next lookup
+        self.memory.max_entries = 3
+        self.memory.evict()
+        self.assertTrue(self.memory._fuzzy is None)
+        self.assertEqual(len(self.sources(u'the ant sat on the mat', 0.6)), 3)
+        self.assertEqual((self.memory._fuzzy.live, self.memory._fuzzy.removed), (3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
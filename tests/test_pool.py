@@ -0,0 +1,19 @@
+'''
+Tests of the thread pool.
+'''
+
+import unittest
+
+from translator import ThreadPool
+
+
+class ThreadPoolTest(unittest.TestCase):
+
+    def test_no_workers_configured(self):
+        pool = ThreadPool(0, 'test')
+        self.assertEqual(pool.workers, 1)
+        self.assertEqual(pool.submit(lambda x: x * 2, 21).result(5), 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Tests of splitting long lines and of the size of the requests.
+'''
+
+import json
+import unittest
+import urlparse
+
+from translator import Engine, GoogleBackend, MicrosoftBackend, SegmentCache
+from translator import segmenter
+from translator.backends import MAX_URL
+
+
+LINES = [
+    u'',
+    u'   ',
+    u'One sentence.',
+    u'  Leading and trailing whitespace.  ',
+    u'First sentence.  Second one!\tThird?… Fourth。Fifth',
+    u'word ' * 60,
+    u'x' * 250,
+    u'Привет, мир. ' * 20,
+    u'"Quotes", commas, and \\ backslashes.  ' * 10,
+]
+
+
+class SplitTest(unittest.TestCase):
+
+    def test_join_restores_line(self):
+        for limit in (1, 5, 20, 100):
+            for line in LINES:
+                pieces, glue = segmenter.split(line, limit)
+                self.assertEqual(segmenter.join(pieces, glue), line)
+                self.assertTrue(all(len(piece) <= limit for piece in pieces))
+
+
+class EchoHTTP(object):
+    ''' ConnectionPool answering every request with its own text, and
+    keeping the length of the longest URL '''
+
+    def __init__(self):
+        self.longest = 0
+
+    def get(self, url, backend=None, waited=0.0):
+        self.longest = max(self.longest, len(url))
+        query = urlparse.parse_qs(urlparse.urlsplit(url).query)
+        if 'texts' in query:
+            answers = [{'TranslatedText': text} for text in json.loads(query['texts'][0])]
+            return 'mycallback(%s);' % json.dumps(answers)
+        answers = [{'responseStatus': 200, 'responseData': {'translatedText': text}}
+                   for text in query['q']]
+        if len(answers) == 1:
+            return json.dumps(answers[0])
+        return json.dumps({'responseData': answers})
+
+
+class RequestSizeTest(unittest.TestCase):
+
+    def check(self, cls, max_chars):
+        http = EchoHTTP()
+        backend = cls(http, max_lines=1000, max_chars=max_chars)
+        engine = Engine([backend], {backend.name: 1}, SegmentCache())
+        lines = [line + unicode(i) for i in range(40) for line in LINES]
+        translations, stats = engine.translate(backend.name, lines, 'zh-CN', 'zh-TW')
+        self.assertEqual(translations, lines)
+        self.assertEqual(stats.failed, [])
+        self.assertTrue(http.longest <= MAX_URL, http.longest)
+
+    def test_google(self):
+        self.check(GoogleBackend, 1500)
+        self.check(GoogleBackend, 100000)
+
+    def test_microsoft(self):
+        self.check(MicrosoftBackend, 1500)
+        self.check(MicrosoftBackend, 100000)
+
+
+if __name__ == '__main__':
+    unittest.main()
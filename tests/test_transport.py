@@ -0,0 +1,68 @@
+'''
+Tests of the keep-alive connection pool.
+'''
+
+import httplib
+import socket
+import unittest
+
+from translator import transport
+from translator.metrics import Recorder
+from translator.transport import ConnectionPool
+
+
+class FailingConnection(object):
+    ''' HTTPConnection whose requests fail '''
+
+    made = []
+    error = socket.error('connection reset')
+
+    def __init__(self, host, timeout=None):
+        self.closed = False
+        FailingConnection.made.append(self)
+
+    def request(self, method, path, body=None, headers=None):
+        raise FailingConnection.error
+
+    def close(self):
+        self.closed = True
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        FailingConnection.made = []
+        FailingConnection.error = socket.error('connection reset')
+        self.connection = httplib.HTTPConnection
+        transport.httplib.HTTPConnection = FailingConnection
+
+    def tearDown(self):
+        transport.httplib.HTTPConnection = self.connection
+
+    def test_failed_retry_closes_connections(self):
+        pool = ConnectionPool()
+        pool._give_back('example.com', FailingConnection('example.com'))
+        self.assertRaises(socket.error, pool.request, 'example.com', 'GET', '/')
+        self.assertEqual(len(FailingConnection.made), 2)
+        self.assertTrue(all(conn.closed for conn in FailingConnection.made))
+
+    def test_no_retry_of_post(self):
+        pool = ConnectionPool()
+        pool._give_back('example.com', FailingConnection('example.com'))
+        self.assertRaises(socket.error, pool.request, 'example.com', 'POST', '/', '{}')
+        self.assertEqual(len(FailingConnection.made), 1)
+        self.assertTrue(FailingConnection.made[0].closed)
+
+    def test_unicode_error_recorded(self):
+        FailingConnection.error = socket.error(u'Verbindung zur\xfcckgesetzt')
+        calls = []
+        recorder = Recorder()
+        recorder.add_observer(calls.append)
+        pool = ConnectionPool(recorder=recorder)
+        self.assertRaises(socket.error, pool.get, 'http://example.com/')
+        self.assertEqual(len(calls), 1)
+        self.assertTrue('Verbindung' in calls[0].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+'''
+Tests of the Wordnik client as used by the dictionary window.
+'''
+
+import os
+import subprocess
+import sys
+import unittest
+
+from translator import Recorder, Response
+from wordnik import Wordnik
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakePool(object):
+    ''' Connection pool answering every request with one JSON body '''
+
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+
+    def request(self, host, method, path, body=None, headers=None):
+        self.requests.append((host, method, path))
+        return Response(200, 'OK', {}, self.body, 0.001, 0.01)
+
+
+class WordnikTest(unittest.TestCase):
+
+    def test_calls_recorded(self):
+        pool = FakePool('[{"text": "a small animal"}]')
+        recorder = Recorder()
+        calls = []
+        recorder.add_observer(calls.append)
+        wordnik = Wordnik(api_key='key', pool=pool, recorder=recorder)
+        self.assertEqual(wordnik._do_http('/word.json/cat/definitions', {}),
+                         [{'text': 'a small animal'}])
+        self.assertEqual(len(pool.requests), 1)
+        self.assertEqual([(call.backend, call.status) for call in calls], [('Wordnik', 200)])
+        self.assertEqual(recorder.summary()['Wordnik']['calls'], 1)
+
+    def test_import_without_translator(self):
+        # the client does not load the application
+        loaded = subprocess.check_output(
+            [sys.executable, '-c', 'import sys, wordnik; print "translator" in sys.modules'],
+            cwd=ROOT)
+        self.assertEqual(loaded.strip(), 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+'''
+Translation engine for Gnotran.
+
+Nothing in this package imports gtk, so it can be used without the GUI.
+'''
+
+# Exceptions
+from backends import TranslationError
+from transport import HTTPError
+from engine import Cancelled
+
+# Backends
+from backends import Backend, GoogleBackend, MicrosoftBackend, LocalBackend, BACKENDS
+from hedging import HedgedBackend, LatencyTracker
+
+# Languages
+from languages import LANGUAGES, language_code
+
+# Batching
+from batch import pack_lines, BatchStats, OrderedAssembler, MAX_LINES, MAX_CHARS
+
+# Caches and translation memory
+from memory import TranslationMemory
+from fuzzy import FuzzyIndex, FUZZY_THRESHOLD, adapt
+from cache import LRUCache, SegmentCache
+
+# Execution
+from pool import ThreadPool, Future
+from transport import ConnectionPool, Response
+from singleflight import SingleFlight
+from limiter import AdaptiveLimiter
+from metrics import Recorder, Call, Histogram, JsonLinesExporter, recorder
+from profiling import Profile, ThreadProfile, profiled
+
+from engine import Engine, Job
+
+# Files
+from document import translate_file, Checkpoint, checkpoint_path
+from exchange import import_file, export_file, import_tmx, export_tmx, import_tsv, export_tsv
@@ -0,0 +1,6 @@
+import sys
+
+from translator.cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,202 @@
+'''
+Translator backends.
+
+Every backend sends a batch of unicode lines in one request and returns
+the list of their translations in the same order.
+'''
+
+import json
+import time
+import urllib
+
+from batch import pack_lines, MAX_LINES, MAX_CHARS
+from limiter import AdaptiveLimiter
+from transport import ConnectionPool, HTTPError
+
+
+GOOGLE_URL = 'http://ajax.googleapis.com/ajax/services/language/translate'
+MICROSOFT_URL = 'http://api.microsofttranslator.com/V2/Ajax.svc/TranslateArray'
+MICROSOFT_APP_ID = '18148BBCC187B05F6D0B99CD249C60A833E67944'
+
+# longest URL the services accept
+MAX_URL = 2000
+# room left in the URL for parameters other than the text
+URL_OVERHEAD = 100
+
+# used when no ConnectionPool is given
+shared_http = ConnectionPool()
+
+
+class TranslationError(Exception):
+    '''Raised when the translator does not return a usable response.'''
+
+
+def quote(text):
+    ''' URL-quote unicode text '''
+    return urllib.quote(text.encode('utf-8'))
+
+
+def unescape(text):
+    ''' Replace HTML entities returned by translators '''
+    text = text.replace('&#39;', '\'')
+    text = text.replace('&quot;', '\"')
+    return text
+
+
+def strip_callback(text):
+    ''' Remove JSONP wrapper: mycallback(...); '''
+    try:
+        return text[text.index('(') + 1:text.rindex(')')]
+    except ValueError:
+        raise TranslationError('Not a JSONP response')
+
+
+class Backend(object):
+    ''' Base class of translator backends.
+
+    Subclasses set `name` and implement request(), which translates one
+    batch of lines with a single call to the service, and cost(), the
+    length one line adds to that request.
+    '''
+
+    name = None
+    max_url = MAX_URL
+
+    def __init__(self, http=None, max_lines=MAX_LINES, max_chars=MAX_CHARS,
+                 limiter=None):
+        self.http = http or shared_http
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.limiter = limiter or AdaptiveLimiter()
+
+    def fetch(self, url):
+        ''' GET url through the limiter of this backend '''
+        waiting = time.time()
+        self.limiter.acquire()
+        started = time.time()
+        try:
+            body = self.http.get(url, self.name, started - waiting)
+        except HTTPError, e:
+            self.limiter.release(time.time() - started, False, e.status)
+            raise
+        except Exception:
+            self.limiter.release(time.time() - started, False)
+            raise
+        self.limiter.release(time.time() - started)
+        return body
+
+    def cost(self, line):
+        ''' Size the line adds to a request '''
+        return len(line)
+
+    def limit(self):
+        ''' Largest total cost of the lines of one request '''
+        return min(self.max_chars, self.max_url - len(self.url) - URL_OVERHEAD)
+
+    def batches(self, items):
+        ''' Pack (index, line) pairs into batches for request() '''
+        return pack_lines(items, self.max_lines, self.limit(), self.cost)
+
+    def request(self, lines, c_from, c_to):
+        raise NotImplementedError
+
+    def translate(self, segments, src, dst):
+        ''' Translate a list of segments, return their translations '''
+        translations = [u''] * len(segments)
+        for batch in self.batches(enumerate(segments)):
+            result = self.request([line for i, line in batch], src, dst)
+            for (i, line), translation in zip(batch, result):
+                translations[i] = translation
+        return translations
+
+
+class GoogleBackend(Backend):
+    ''' Google AJAX Language API '''
+
+    name = 'Google'
+    url = GOOGLE_URL
+
+    def cost(self, line):
+        return len('&q=' + quote(line))
+
+    def request(self, lines, c_from, c_to):
+        url = self.url + '?v=1.0&langpair=' + c_from + '|' + c_to
+        url += ''.join('&q=' + quote(line) for line in lines)
+        try:
+            response_dict = json.loads(self.fetch(url))
+        except Exception:
+            raise TranslationError('error connecting to Google')
+
+        # one "q" gives a single answer, several "q" give a list of answers
+        if len(lines) == 1:
+            answers = [response_dict]
+        else:
+            answers = response_dict.get('responseData')
+        if not isinstance(answers, list) or len(answers) != len(lines):
+            raise TranslationError('unexpected response from Google')
+
+        # an answer with an error status fails the batch, like a failed request
+        if not all(isinstance(answer, dict) and answer.get('responseStatus') == 200
+                   for answer in answers):
+            raise TranslationError('unexpected response from Google')
+        try:
+            return [unescape(answer['responseData']['translatedText']) for answer in answers]
+        except (KeyError, TypeError):
+            raise TranslationError('unexpected response from Google')
+
+
+class MicrosoftBackend(Backend):
+    ''' Microsoft Translator AJAX API '''
+
+    name = 'Microsoft'
+    url = MICROSOFT_URL
+    app_id = MICROSOFT_APP_ID
+
+    def cost(self, line):
+        # an item of the JSON list and the quoted comma before it
+        return len(urllib.quote(json.dumps(line))) + len('%2C')
+
+    def limit(self):
+        # the application id comes on top of the other parameters
+        return min(self.max_chars,
+                   self.max_url - len(self.url) - len(self.app_id) - URL_OVERHEAD)
+
+    def request(self, lines, c_from, c_to):
+        url = self.url + '?oncomplete=mycallback&appId=' + self.app_id
+        # no spaces after the commas, cost() does not count them
+        url += '&texts=' + urllib.quote(json.dumps(lines, separators=(',', ':')))
+        url += '&from=%s&to=%s' % (c_from, c_to)
+        try:
+            s = self.fetch(url)
+            answers = json.loads(strip_callback(s))
+        except TranslationError:
+            raise
+        except Exception:
+            raise TranslationError('error connecting to Microsoft')
+
+        if not isinstance(answers, list) or len(answers) != len(lines):
+            raise TranslationError('unexpected response from Microsoft')
+        # an entry with an error instead of a translation fails the batch
+        if not all(isinstance(answer, dict) and 'TranslatedText' in answer for answer in answers):
+            raise TranslationError('unexpected response from Microsoft')
+        return [unescape(answer['TranslatedText']) for answer in answers]
+
+
+class LocalBackend(Backend):
+    ''' Offline stand-in that returns lines unchanged.
+
+    Useful for tests and benchmarks of everything around the network.
+    '''
+
+    name = 'Local'
+    url = ''
+
+    def request(self, lines, c_from, c_to):
+        return list(lines)
+
+
+BACKENDS = {
+    'Google': GoogleBackend,
+    'Microsoft': MicrosoftBackend,
+    'Local': LocalBackend,
+}
@@ -0,0 +1,141 @@
+'''
+Packing of many lines into one request to the translator.
+'''
+
+import time
+
+
+MAX_LINES = 50
+MAX_CHARS = 1500
+
+
+def pack_lines(items, max_lines=MAX_LINES, max_chars=MAX_CHARS, size=len):
+    ''' Group (index, line) pairs into batches.
+
+    Every batch has at most max_lines lines and a total size(line) of
+    at most max_chars.  A line bigger than max_chars gets a batch of its
+    own.
+    '''
+    batch = []
+    total = 0
+    for index, line in items:
+        line_size = size(line)
+        if batch and (len(batch) >= max_lines or total + line_size > max_chars):
+            yield batch
+            batch = []
+            total = 0
+        batch.append((index, line))
+        total += line_size
+    if batch:
+        yield batch
+
+
+class BatchStats(object):
+    ''' Requests and throughput of one translated document '''
+
+    def __init__(self):
+        self.requests = 0
+        self.lines = 0
+        # lines taken from translation memory, exact and fuzzy matches
+        self.cached = 0
+        self.fuzzy = 0
+        # lines to translate and how many of them were distinct
+        self.segments = 0
+        self.distinct = 0
+        # distinct lines taken from a request of another job
+        self.shared = 0
+        # requests that failed after all retries, and indexes of the
+        # segments left untranslated
+        self.errors = 0
+        self.failed = []
+        # backend name -> lines it translated, and the backend of every line
+        self.served = {}
+        self.served_by = {}
+        self.started = time.time()
+        self.finished = None
+
+    def add(self, lines, backend=None):
+        ''' Count one request carrying the given lines '''
+        self.requests += 1
+        self.lines += len(lines)
+        if backend:
+            self.served[backend] = self.served.get(backend, 0) + len(lines)
+            for line in lines:
+                self.served_by[line] = backend
+
+    def merge(self, other):
+        ''' Add counters of another BatchStats '''
+        self.requests += other.requests
+        self.lines += other.lines
+        self.cached += other.cached
+        self.fuzzy += other.fuzzy
+        self.segments += other.segments
+        self.distinct += other.distinct
+        self.shared += other.shared
+        self.errors += other.errors
+        for backend, lines in other.served.items():
+            self.served[backend] = self.served.get(backend, 0) + lines
+        self.served_by.update(other.served_by)
+
+    def finish(self):
+        self.finished = time.time()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def lines_per_sec(self):
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.lines / elapsed
+
+    def dedup_ratio(self):
+        ''' Part of the lines that were copies of other lines '''
+        if not self.segments:
+            return 0.0
+        return 1 - float(self.distinct) / self.segments
+
+    def __str__(self):
+        text = '%d lines in %d requests (%.1f lines/sec)' % (
+            self.lines, self.requests, self.lines_per_sec())
+        if self.cached:
+            text += ', %d from memory' % self.cached
+        if self.fuzzy:
+            text += ', %d fuzzy' % self.fuzzy
+        if self.distinct < self.segments:
+            text += ', %d%% duplicates' % (self.dedup_ratio() * 100)
+        if self.shared:
+            text += ', %d shared' % self.shared
+        if self.failed:
+            text += ', %d failed' % len(self.failed)
+        if len(self.served) > 1:
+            text += ', ' + ', '.join('%s %d' % item for item in sorted(self.served.items()))
+        return text
+
+
+class OrderedAssembler(object):
+    ''' Collect results that finish out of order and release them as
+    contiguous runs in the original order.
+
+    on_ready(start, items) is called with every new run, beginning at
+    index 0.
+    '''
+
+    def __init__(self, size, on_ready):
+        self.items = [None] * size
+        self.ready = 0
+        self._filled = [False] * size
+        self._on_ready = on_ready
+
+    def add(self, index, item):
+        self.items[index] = item
+        self._filled[index] = True
+
+    def flush(self):
+        ''' Release the run of filled items following the last release '''
+        start = end = self.ready
+        while end < len(self.items) and self._filled[end]:
+            end += 1
+        if end > start:
+            self.ready = end
+            self._on_ready(start, self.items[start:end])
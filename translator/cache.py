@@ -0,0 +1,94 @@
+'''
+In-process LRU cache of translated lines, bounded in bytes.
+'''
+
+import sys
+import threading
+from collections import OrderedDict
+
+from memory import normalize
+
+
+MAX_BYTES = 16 * 1024 * 1024
+
+
+def entry_size(key, value):
+    ''' Approximate memory used by one cache entry '''
+    return sum(sys.getsizeof(part) for part in key) + sys.getsizeof(value)
+
+
+class LRUCache(object):
+    ''' Least recently used entries are evicted when the cache grows
+    over max_bytes '''
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= entry_size(key, old)
+            self._entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.size -= entry_size(old_key, old_value)
+                self.evictions += 1
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return '%d%% hits, %d evictions, %.1f KB' % (
+            self.hit_rate() * 100, self.evictions, self.size / 1024.0)
+
+
+class SegmentCache(LRUCache):
+    ''' LRU cache of translations keyed by (api, c_from, c_to, line).
+
+    Every translation is stored in both directions, so translating the
+    result back (e.g. from the other pane) is a hit too.
+    '''
+
+    def get_many(self, api, c_from, c_to, lines):
+        ''' Return {line: translation} for the lines found in cache '''
+        found = {}
+        for line in lines:
+            translation = self.get((api, c_from, c_to, normalize(line)))
+            if translation is not None:
+                found[line] = translation
+        return found
+
+    def put_many(self, api, c_from, c_to, pairs):
+        ''' Store (line, translation) pairs and their reverse '''
+        for line, translation in pairs:
+            if not translation:
+                continue
+            self.put((api, c_from, c_to, normalize(line)), translation)
+            self.put((api, c_to, c_from, normalize(translation)), line)
@@ -0,0 +1,198 @@
+'''
+Command-line batch translation.
+
+    python -m translator -f english -t russian [options] [FILE ...]
+
+Reads FILEs (or standard input) line by line and writes the translation
+to standard output as soon as it is ready.  With -o, one FILE is
+translated into OUTPUT with a checkpoint, and a run that was interrupted
+goes on where it stopped when started again.
+
+    python -m translator -m MEMORY --import FILE.tmx
+    python -m translator -m MEMORY -f LANG -t LANG --export FILE.tsv
+
+load or save the translation memory; TMX holds all language pairs
+unless -f or -t is given, TSV holds one.
+'''
+
+import sys
+from optparse import OptionParser
+
+from backends import BACKENDS, TranslationError
+from batch import BatchStats, MAX_LINES, MAX_CHARS
+from cache import SegmentCache
+from document import translate_file
+from engine import Engine
+from exchange import import_file, export_file
+from hedging import HedgedBackend
+from limiter import AdaptiveLimiter
+from languages import language_code
+from memory import TranslationMemory
+from metrics import recorder, JsonLinesExporter
+from profiling import profiled, enable as enable_profiling
+from transport import ConnectionPool
+
+
+def read_lines(filenames):
+    ''' Unicode lines of files, "-" is standard input '''
+    for filename in filenames:
+        if filename == '-':
+            stream = sys.stdin
+        else:
+            stream = open(filename, 'rb')
+        try:
+            for line in stream:
+                yield line.rstrip('\r\n').decode('utf-8')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def make_parser():
+    parser = OptionParser(prog='translator',
+                          usage='python -m translator -f LANG -t LANG [options] [FILE ...]')
+    parser.add_option('-f', '--from', dest='lang_from', default=None,
+                      help='source language, name or code [english]')
+    parser.add_option('-t', '--to', dest='lang_to', default=None,
+                      help='target language, name or code [russian]')
+    apis = sorted(BACKENDS) + ['Auto']
+    parser.add_option('-a', '--api', default='Google', choices=apis,
+                      help='translator: %s [%%default]' % ', '.join(apis))
+    parser.add_option('-w', '--workers', type='int', default=4,
+                      help='concurrent requests [%default]')
+    parser.add_option('--batch-lines', type='int', default=MAX_LINES,
+                      help='lines per request [%default]')
+    parser.add_option('--batch-chars', type='int', default=MAX_CHARS,
+                      help='characters per request [%default]')
+    parser.add_option('--window', type='int', default=None,
+                      help='lines read ahead [200 per worker]')
+    parser.add_option('--timeout', type='float', default=30,
+                      help='timeout of one request, seconds [%default]')
+    parser.add_option('--retries', type='int', default=3,
+                      help='retries of a failed request [%default]')
+    parser.add_option('--max-rps', type='float', default=None,
+                      help='requests per second ceiling for every translator')
+    parser.add_option('-m', '--memory', default=None,
+                      help='translation memory file (SQLite)')
+    parser.add_option('--cache-only', action='store_true', default=False,
+                      help='translate from translation memory only')
+    parser.add_option('--import', dest='import_path', default=None, metavar='FILE',
+                      help='load a .tmx or .tsv file into the translation memory')
+    parser.add_option('--export', dest='export_path', default=None, metavar='FILE',
+                      help='save the translation memory as a .tmx or .tsv file')
+    parser.add_option('--fuzzy', type='float', default=None, metavar='SIMILARITY',
+                      help='use memory entries at least this similar (0-1) instead of sending')
+    parser.add_option('-o', '--output', default=None,
+                      help='translate one FILE into OUTPUT, resumable')
+    parser.add_option('--restart', action='store_true', default=False,
+                      help='with -o, ignore the checkpoint and start over')
+    parser.add_option('--metrics', default=None, metavar='FILE',
+                      help='append every HTTP call to FILE as JSON lines')
+    parser.add_option('--profile', default=None, metavar='DIR',
+                      help='write cProfile and memory reports to DIR')
+    parser.add_option('-v', '--verbose', action='store_true', default=False,
+                      help='print statistics to standard error')
+    return parser
+
+
+def transfer(options, c_from, c_to):
+    ''' Import or export the translation memory '''
+    pairs = None
+    if options.lang_from or options.lang_to:
+        pairs = [(c_from, c_to)]
+    memory = TranslationMemory(options.memory)
+    try:
+        for path, function in ((options.import_path, import_file),
+                               (options.export_path, export_file)):
+            if not path:
+                continue
+            if pairs is None and not path.lower().endswith('.tmx'):
+                # TSV: the default pair
+                stats = function(memory, path, [(c_from, c_to)])
+            else:
+                stats = function(memory, path, pairs)
+            print >> sys.stderr, '%s: %s.' % (path, stats)
+    except (EnvironmentError, SyntaxError, ValueError), e:
+        # SyntaxError: malformed XML
+        print >> sys.stderr, 'Error (%s).' % e
+        return 1
+    finally:
+        memory.close()
+    return 0
+
+
+def main(argv=None):
+    parser = make_parser()
+    options, filenames = parser.parse_args(argv)
+    try:
+        c_from = language_code(options.lang_from or 'english')
+        c_to = language_code(options.lang_to or 'russian')
+    except KeyError, e:
+        parser.error('unknown language: %s' % e)
+    if options.profile:
+        enable_profiling(options.profile)
+    if options.import_path or options.export_path:
+        if not options.memory:
+            parser.error('--import and --export need a translation memory (-m)')
+        return profiled('transfer', transfer)(options, c_from, c_to)
+    if options.fuzzy is not None and not options.memory:
+        parser.error('--fuzzy needs a translation memory (-m)')
+    if options.output and len(filenames) != 1:
+        parser.error('-o needs exactly one FILE')
+    return profiled('cli', translate)(options, filenames, c_from, c_to)
+
+
+def translate(options, filenames, c_from, c_to):
+    ''' Translate the files, or standard input, return the exit status '''
+    if options.metrics:
+        recorder.add_observer(JsonLinesExporter(options.metrics))
+    http = ConnectionPool(max(options.workers, 1), timeout=options.timeout)
+    def make_backend(name):
+        limiter = AdaptiveLimiter(maximum=max(options.workers, 1), rps=options.max_rps)
+        return BACKENDS[name](http, options.batch_lines, options.batch_chars, limiter)
+
+    if options.api == 'Auto':
+        backend = HedgedBackend([make_backend('Google'), make_backend('Microsoft')],
+                                options.workers)
+    else:
+        backend = make_backend(options.api)
+    memory = None
+    if options.memory:
+        memory = TranslationMemory(options.memory)
+    engine = Engine([backend], {options.api: options.workers}, SegmentCache(), memory)
+    engine.cache_only = options.cache_only
+    engine.fuzzy = options.fuzzy
+    engine.retries = options.retries
+
+    stats = BatchStats()
+    try:
+        if options.output:
+            resumed, stats = translate_file(engine, options.api, filenames[0], options.output,
+                                            c_from, c_to, options.window,
+                                            resume=not options.restart)
+            if resumed:
+                print >> sys.stderr, 'Resumed after line %d.' % resumed
+        else:
+            lines = read_lines(filenames or ['-'])
+            for translation in engine.translate_stream(options.api, lines, c_from, c_to,
+                                                       options.window, stats):
+                sys.stdout.write(translation.encode('utf-8') + '\n')
+    except TranslationError, e:
+        print >> sys.stderr, 'Translation Error (%s).' % e
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+    stats.finish()
+    if stats.failed:
+        print >> sys.stderr, '%d lines could not be translated, first: line %d.' % (
+            len(stats.failed), stats.failed[0] + 1)
+    if options.verbose:
+        print >> sys.stderr, str(stats)
+        for member in getattr(backend, 'members', [backend]):
+            print >> sys.stderr, '%s concurrency limit: %s' % (member.name, member.limiter)
+        if recorder.backends:
+            print >> sys.stderr, 'Requests: %s' % recorder
+    if stats.failed:
+        return 1
+    return 0
@@ -0,0 +1,176 @@
+'''
+Resumable translation of large files.
+
+The source file is memory-mapped and read one window of lines at a time,
+translations are appended to the target file as soon as they are ready,
+and a small checkpoint file next to the target records how far both
+files got.  An interrupted job started again with the same files goes on
+from the last written line, so memory and rework do not grow with the
+size of the document.
+'''
+
+import json
+import mmap
+import os
+import time
+
+from batch import BatchStats
+from engine import WINDOW_PER_WORKER
+
+
+# the checkpoint is written at most this often while lines are coming in
+CHECKPOINT_EVERY = 1.0
+
+
+def checkpoint_path(target):
+    return target + '.checkpoint'
+
+
+class Checkpoint(object):
+    ''' Progress of one file translation: bytes of the source read and of
+    the target written, and lines done.
+
+    A checkpoint is only valid for the same source file (size and
+    modification time) and the same translator and languages.
+    '''
+
+    def __init__(self, path, key):
+        self.path = path
+        # as it reads back from the file
+        self.key = json.loads(json.dumps(key))
+        self.source_offset = 0
+        self.target_offset = 0
+        self.lines = 0
+        self._saved = 0
+
+    def load(self):
+        ''' Read the saved progress, return False if there is none for the key '''
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return False
+        if data.get('key') != self.key:
+            return False
+        self.source_offset = data['source_offset']
+        self.target_offset = data['target_offset']
+        self.lines = data['lines']
+        return True
+
+    def due(self):
+        ''' Whether it is time to save again '''
+        return time.time() - self._saved >= CHECKPOINT_EVERY
+
+    def save(self):
+        ''' Write the progress, atomically '''
+        data = {'key': self.key,
+                'source_offset': self.source_offset,
+                'target_offset': self.target_offset,
+                'lines': self.lines}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path)
+        self._saved = time.time()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def read_window(data, offset, count):
+    ''' Up to count lines of the mapped file from byte offset: a list of
+    unicode lines and a list of the byte offsets where they end '''
+    lines = []
+    ends = []
+    size = len(data)
+    while offset < size and len(lines) < count:
+        end = data.find('\n', offset)
+        if end < 0:
+            end = size
+            next_offset = size
+        else:
+            next_offset = end + 1
+        lines.append(data[offset:end].rstrip('\r').decode('utf-8'))
+        ends.append(next_offset)
+        offset = next_offset
+    return lines, ends
+
+
+def translate_file(engine, api, source, target, src, dst, window=None,
+                   progress=None, job=None, resume=True):
+    ''' Translate the utf-8 file source into target, line by line.
+
+    Lines are translated `window` at a time (WINDOW_PER_WORKER per
+    request thread by default) and appended to target as soon as a run
+    of them is ready.  With resume, a checkpoint left by an interrupted
+    job of the same files is continued; otherwise target is started
+    over.  progress(done, total) is called with bytes of the source.
+    Cancelled is raised if job is cancelled, and the checkpoint is kept
+    for the next run.  Returns (resumed, stats): the number of lines
+    found already done, and stats of the lines translated by this run,
+    with stats.failed numbered from the start of the file.
+    '''
+    if window is None:
+        pool = engine.pools.get(api)
+        window = WINDOW_PER_WORKER * (pool.workers if pool else 1)
+    info = os.stat(source)
+    key = [os.path.abspath(source), info.st_size, info.st_mtime, api, src, dst]
+    checkpoint = Checkpoint(checkpoint_path(target), key)
+    if not (resume and checkpoint.load() and os.path.exists(target)
+            and os.path.getsize(target) >= checkpoint.target_offset):
+        checkpoint = Checkpoint(checkpoint.path, key)
+
+    resumed = checkpoint.lines
+    stats = BatchStats()
+    # a missing target is created, lines after the checkpoint are dropped
+    out = open(target, 'r+b' if os.path.exists(target) else 'w+b')
+    try:
+        out.truncate(checkpoint.target_offset)
+        out.seek(checkpoint.target_offset)
+        if info.st_size == 0:
+            checkpoint.remove()
+            return resumed, stats
+        f = open(source, 'rb')
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        try:
+            while checkpoint.source_offset < info.st_size:
+                lines, ends = read_window(data, checkpoint.source_offset, window)
+                first = checkpoint.lines
+
+                def write(start, translations):
+                    for translation in translations:
+                        out.write(translation.encode('utf-8') + '\n')
+                    out.flush()
+                    checkpoint.source_offset = ends[start + len(translations) - 1]
+                    checkpoint.target_offset = out.tell()
+                    checkpoint.lines = first + start + len(translations)
+                    if checkpoint.due():
+                        # the checkpoint never gets ahead of the target
+                        os.fsync(out.fileno())
+                        checkpoint.save()
+                    if progress:
+                        progress(checkpoint.source_offset, info.st_size)
+
+                try:
+                    translations, window_stats = engine.translate(api, lines, src, dst,
+                                                                  on_ready=write, job=job)
+                finally:
+                    # also when cancelled or interrupted: keep what was written
+                    os.fsync(out.fileno())
+                    checkpoint.save()
+                stats.merge(window_stats)
+                stats.failed.extend(first + i for i in window_stats.failed)
+        finally:
+            data.close()
+    finally:
+        out.close()
+    checkpoint.remove()
+    return resumed, stats
@@ -0,0 +1,301 @@
+'''
+Translation engine: caches, translation memory and parallel batched
+requests in front of the translator backends.
+'''
+
+import random
+import threading
+from itertools import islice
+
+import segmenter
+from backends import TranslationError
+from batch import BatchStats, OrderedAssembler
+from fuzzy import adapt
+from pool import ThreadPool
+from singleflight import SingleFlight
+
+
+# lines read ahead by translate_stream for every request thread
+WINDOW_PER_WORKER = 200
+
+# attempts after the first failed request of a batch
+RETRIES = 3
+# delay before the first retry, doubled for every next one, seconds
+BACKOFF = 0.5
+# a segment that could not be translated is shown like this
+FAILED_MARK = u'[untranslated] %s'
+
+
+class Cancelled(Exception):
+    '''Raised by Engine.translate when its Job was cancelled.'''
+
+
+class Job(object):
+    ''' Handle of one translation, used to cancel it '''
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        ''' Raise Cancelled if the job was cancelled '''
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        ''' Wait, but raise Cancelled as soon as the job is cancelled '''
+        self._cancelled.wait(seconds)
+        self.check()
+
+
+class Failed(object):
+    ''' Result of a batch that failed after all retries '''
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Engine(object):
+    ''' Translate documents with a set of backends.
+
+    backends is a list of Backend objects, workers maps a backend name
+    to the number of concurrent requests for it (one by default).  The
+    SegmentCache and TranslationMemory are optional.  With cache_only
+    set nothing is sent and lines missing from memory are left as is.
+    With fuzzy set to a similarity (0 to 1), a line missing from memory
+    takes the translation of the most similar line stored, if it is at
+    least that similar, instead of being sent.
+    A failed request is retried `retries` times with jittered
+    exponential backoff starting at `backoff` seconds.
+    '''
+
+    def __init__(self, backends, workers=None, cache=None, memory=None):
+        self.backends = dict((backend.name, backend) for backend in backends)
+        workers = workers or {}
+        self.pools = {}
+        for name in self.backends:
+            if workers.get(name, 1) > 1:
+                self.pools[name] = ThreadPool(workers[name], name.lower())
+        self.cache = cache
+        self.memory = memory
+        self.cache_only = False
+        self.fuzzy = None
+        self.flights = SingleFlight()
+        self.retries = RETRIES
+        self.backoff = BACKOFF
+
+    def translate(self, api, segments, src, dst, progress=None, on_ready=None,
+                  job=None):
+        ''' Translate a list of unicode segments from src to dst with
+        backend api.
+
+        Segments too long for one request are split at sentence ends and
+        joined again, with their whitespace, after translation.  Parts
+        that could not be translated keep the source text marked with
+        FAILED_MARK, and the indexes of their segments are listed in
+        stats.failed.  See _translate_pieces() for the rest.
+        '''
+        backend = self.backends[api]
+        limit = backend.limit()
+        assembler = OrderedAssembler(len(segments), on_ready or (lambda start, items: None))
+
+        pieces = []
+        glues = []
+        # the line of every piece, for the last piece of a line
+        line_of = []
+        for i, line in enumerate(segments):
+            line_pieces, glue = segmenter.split(line, limit, backend.cost)
+            glues.append(glue)
+            if not line_pieces:
+                assembler.add(i, line)
+            pieces.extend(line_pieces)
+            line_of.extend([i] * len(line_pieces))
+        assembler.flush()
+
+        translated = [None] * len(pieces)
+        failed = set()
+
+        def pieces_ready(start, translations):
+            translated[start:start + len(translations)] = translations
+            for k in range(start, start + len(translations)):
+                i = line_of[k]
+                if k + 1 == len(line_of) or line_of[k + 1] != i:
+                    first = k + 2 - len(glues[i])
+                    parts = translated[first:k + 1]
+                    if None in parts:
+                        failed.add(i)
+                        parts = [FAILED_MARK % piece if part is None else part
+                                 for piece, part in zip(pieces[first:k + 1], parts)]
+                    assembler.add(i, segmenter.join(parts, glues[i]))
+            assembler.flush()
+
+        # the translations arrive through pieces_ready
+        _, stats = self._translate_pieces(api, pieces, src, dst, progress,
+                                          pieces_ready, job)
+        stats.failed = sorted(failed)
+        return assembler.items, stats
+
+    def _translate_pieces(self, api, segments, src, dst, progress=None,
+                          on_ready=None, job=None):
+        ''' Translate a list of unicode segments, each of them fitting into
+        one request.
+
+        Blank segments, and those found in cache or memory, are not sent.
+        Identical segments are sent once, and a segment already being
+        sent by another job is not sent again: its result is shared.
+        progress(done, total) is called with the number of translated
+        distinct segments after every request.  on_ready(start,
+        translations) is called as soon as a contiguous run of segments
+        is translated, in order, so the output can be shown before the
+        whole document is done.  Segments that failed after all retries
+        are None.  If job is cancelled, its queued requests are dropped
+        and Cancelled is raised; no callback is called after that.
+        Returns (translations, stats).
+        '''
+        job = job or Job()
+        cache = self.cache
+        memory = self.memory
+        assembler = OrderedAssembler(len(segments), on_ready or (lambda start, items: None))
+        stats = BatchStats()
+
+        # positions of every distinct line
+        positions = {}
+        for i, line in enumerate(segments):
+            if line.strip():
+                positions.setdefault(line, []).append(i)
+                stats.segments += 1
+            else:
+                assembler.add(i, u'')
+        stats.distinct = len(positions)
+
+        def done(line, translation):
+            for i in positions.pop(line):
+                assembler.add(i, translation)
+
+        for store in (cache, memory):
+            if store is None or not positions:
+                continue
+            found = store.get_many(api, src, dst, positions.keys())
+            for line, translation in found.items():
+                done(line, translation)
+            stats.cached += len(found)
+            if store is memory and cache is not None:
+                cache.put_many(api, src, dst, found.items())
+        if self.fuzzy and memory is not None and positions:
+            found = memory.fuzzy_many(src, dst, positions.keys(), self.fuzzy, limit=1)
+            for line, matches in found.items():
+                score, source, target = matches[0]
+                done(line, adapt(line, source, target))
+            stats.fuzzy += len(found)
+        if self.cache_only:
+            for line in positions.keys():
+                done(line, line)
+        assembler.flush()
+
+        total = len(positions)
+        state = {'done': 0}
+
+        def finished(pairs):
+            for line, translation in pairs:
+                done(line, translation)
+            assembler.flush()
+            state['done'] += len(pairs)
+            if progress:
+                progress(state['done'], total)
+
+        keys = dict(((api, src, dst, line), line) for line in positions)
+        leading, waiting = self.flights.claim(keys)
+        try:
+            self._send(api, [keys[key] for key in leading], src, dst, job, stats, finished)
+        except Exception, e:
+            self.flights.fail(leading, e)
+            raise
+
+        # lines sent by other jobs; if their request failed, send them here
+        failed = []
+        for key, future in waiting.items():
+            while not future.wait(0.1):
+                job.check()
+            job.check()
+            try:
+                finished([(keys[key], future.result())])
+                stats.shared += 1
+            except Exception:
+                failed.append(keys[key])
+        self._send(api, failed, src, dst, job, stats, finished, share=False)
+
+        stats.finish()
+        return assembler.items, stats
+
+    def _send(self, api, lines, src, dst, job, stats, finished, share=True):
+        ''' Send lines to the backend in batches; finished(pairs) gets
+        the (line, translation) pairs of every batch '''
+        backend = self.backends[api]
+
+        def send(batch):
+            lines = [line for line, same in batch]
+            for attempt in range(self.retries + 1):
+                job.check()
+                try:
+                    return backend.request(lines, src, dst)
+                except TranslationError, e:
+                    if attempt == self.retries:
+                        return Failed(e)
+                    job.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        batches = backend.batches((line, line) for line in lines)
+        pool = self.pools.get(api)
+        if pool is None:
+            results = ((batch, send(batch)) for batch in batches)
+        else:
+            results = pool.imap_unordered(send, batches)
+
+        for batch, result in results:
+            job.check()
+            if isinstance(result, Failed):
+                lines = [line for line, same in batch]
+                if share:
+                    self.flights.fail([(api, src, dst, line) for line in lines], result.error)
+                stats.errors += 1
+                finished([(line, None) for line in lines])
+                continue
+            pairs = [(line, translation) for (line, same), translation in zip(batch, result)]
+            if self.cache is not None:
+                self.cache.put_many(api, src, dst, pairs)
+            if self.memory is not None:
+                self.memory.put_many(api, src, dst, pairs)
+            if share:
+                for line, translation in pairs:
+                    self.flights.resolve((api, src, dst, line), translation)
+            stats.add([line for line, same in batch], getattr(result, 'backend', api))
+            finished(pairs)
+
+    def translate_stream(self, api, lines, src, dst, window=None, stats=None):
+        ''' Translate an iterable of unicode lines lazily.
+
+        Lines are read `window` at a time and translated as one document,
+        so memory does not depend on the length of the input.  Yields
+        translations in input order.  Counters of every window are added
+        to stats, if given.
+        '''
+        if window is None:
+            pool = self.pools.get(api)
+            window = WINDOW_PER_WORKER * (pool.workers if pool else 1)
+        lines = iter(lines)
+        offset = 0
+        while True:
+            chunk = list(islice(lines, window))
+            if not chunk:
+                break
+            translations, chunk_stats = self.translate(api, chunk, src, dst)
+            if stats is not None:
+                stats.merge(chunk_stats)
+                stats.failed.extend(offset + i for i in chunk_stats.failed)
+            offset += len(chunk)
+            for translation in translations:
+                yield translation
@@ -0,0 +1,254 @@
+'''
+Import and export of translation memory as TMX or TSV.
+
+Files are streamed: TMX is read with an incremental parser that drops
+every translation unit once it is stored, rows are inserted in batched
+transactions and exported straight from a database cursor, so memory
+does not depend on the size of the file.  Imported entries get api "*"
+(see memory.ANY_API), serve every translator and are not evicted.
+'''
+
+import codecs
+import os
+import re
+import sqlite3
+import time
+from xml.etree import cElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+from languages import LANGUAGES
+from memory import ANY_API
+
+
+# rows inserted in one transaction
+BATCH = 10000
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+# inline codes of the original format, not text
+NATIVE_CODES = ('bpt', 'ept', 'it', 'ph', 'ut')
+# language tags of other tools that differ from our codes
+ALIASES = {'he': 'iw', 'pt': 'pt-pt', 'zh-hans': 'zh-cn', 'zh-hant': 'zh-tw'}
+
+CODES = set(LANGUAGES.values())
+
+# escaped characters of TSV fields
+TSV_ESCAPES = {'t': '\t', 'n': '\n', '\\': '\\'}
+
+
+def language_code(tag):
+    ''' Our code of a TMX/RFC 3066 language tag like "en-US", or None '''
+    tag = tag.lower().replace('_', '-')
+    for code in (tag, ALIASES.get(tag), tag.split('-')[0], ALIASES.get(tag.split('-')[0])):
+        if code in CODES:
+            return code
+    return None
+
+
+class TransferStats(object):
+    ''' Entries and throughput of one import or export '''
+
+    def __init__(self):
+        self.entries = 0
+        # units without a usable pair of languages, or malformed lines
+        self.skipped = 0
+        self.bytes = 0
+        self.started = time.time()
+        self.finished = None
+
+    def finish(self):
+        self.finished = time.time()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def __str__(self):
+        elapsed = max(self.elapsed(), 1e-6)
+        text = '%d entries in %.1f s (%.0f entries/sec, %.1f MB/sec)' % (
+            self.entries, elapsed, self.entries / elapsed, self.bytes / elapsed / 2 ** 20)
+        if self.skipped:
+            text += ', %d skipped' % self.skipped
+        return text
+
+
+def seg_text(seg):
+    ''' Text of a <seg>, without inline native codes '''
+    parts = [seg.text or u'']
+    for child in seg:
+        if child.tag not in NATIVE_CODES:
+            parts.append(seg_text(child))
+        parts.append(child.tail or u'')
+    return u''.join(parts)
+
+
+def tmx_units(stream):
+    ''' Yield {code: text} of every <tu> of a TMX stream '''
+    body = None
+    for event, element in cElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'body':
+                body = element
+            continue
+        if element.tag != 'tu':
+            continue
+        unit = {}
+        for tuv in element.iter('tuv'):
+            code = language_code(tuv.get(XML_LANG) or tuv.get('lang') or '')
+            seg = tuv.find('seg')
+            if code and seg is not None:
+                unit[code] = seg_text(seg)
+        yield unit
+        # drop the unit, and its empty element from the body
+        element.clear()
+        if body is not None:
+            body.clear()
+
+
+def store(memory, rows, stats, progress=None, position=None):
+    ''' Store rows (c_from, c_to, line, translation) in batches '''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            stats.entries += memory.put_rows(ANY_API, batch)
+            batch = []
+            if progress and position:
+                progress(*position())
+    stats.entries += memory.put_rows(ANY_API, batch)
+
+
+def import_tmx(memory, path, pairs=None, progress=None):
+    ''' Load a TMX file into memory.
+
+    Every unit gives entries for all directions between its languages,
+    or only for the (c_from, c_to) pairs given.  progress(done, total)
+    is called with bytes read.  Returns TransferStats.
+    '''
+    stats = TransferStats()
+    total = os.path.getsize(path)
+
+    def rows(stream):
+        for unit in tmx_units(stream):
+            found = False
+            for c_from, line in unit.items():
+                for c_to, translation in unit.items():
+                    if c_from == c_to or pairs is not None and (c_from, c_to) not in pairs:
+                        continue
+                    found = True
+                    yield c_from, c_to, line, translation
+            if not found:
+                stats.skipped += 1
+
+    with open(path, 'rb') as stream:
+        store(memory, rows(stream), stats, progress, lambda: (stream.tell(), total))
+    stats.bytes = total
+    stats.finish()
+    return stats
+
+
+def unescape_tsv(field):
+    return re.sub(r'\\(.)', lambda m: TSV_ESCAPES.get(m.group(1), m.group(0)), field)
+
+
+def escape_tsv(field):
+    return field.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def import_tsv(memory, path, c_from, c_to, progress=None):
+    ''' Load "line<TAB>translation" rows of a utf-8 file into memory
+    for c_from -> c_to.  Returns TransferStats. '''
+    stats = TransferStats()
+    total = os.path.getsize(path)
+
+    def rows(stream):
+        # readline, not iteration, so that tell() works
+        for row in iter(stream.readline, ''):
+            fields = row.rstrip('\r\n').split('\t')
+            if len(fields) != 2:
+                stats.skipped += 1
+                continue
+            line, translation = [unescape_tsv(field).decode('utf-8') for field in fields]
+            yield c_from, c_to, line, translation
+
+    with open(path, 'rb') as stream:
+        store(memory, rows(stream), stats, progress, lambda: (stream.tell(), total))
+    stats.bytes = total
+    stats.finish()
+    return stats
+
+
+def memory_rows(memory, pairs=None):
+    ''' (c_from, c_to, source, target) of all entries, or of some language
+    pairs, sorted; of entries of several translators for the same line,
+    the most recently used one.  Read with a connection of its own so the
+    memory stays usable. '''
+    db = sqlite3.connect(memory.path)
+    try:
+        query = 'SELECT c_from, c_to, source, target FROM segments'
+        order = ' ORDER BY c_from, c_to, source, used DESC'
+        if pairs is None:
+            cursors = [db.execute(query + order)]
+        else:
+            cursors = (db.execute(query + ' WHERE c_from=? AND c_to=?' + order, pair)
+                       for pair in pairs)
+        for cursor in cursors:
+            last = None
+            for row in cursor:
+                if row[:3] != last:
+                    last = row[:3]
+                    yield row
+    finally:
+        db.close()
+
+
+def export_tmx(memory, path, pairs=None):
+    ''' Write all entries, or those of some (c_from, c_to) pairs, to a
+    TMX file.  Returns TransferStats. '''
+    stats = TransferStats()
+    with codecs.open(path, 'wb', 'utf-8') as out:
+        out.write(u'<?xml version="1.0" encoding="UTF-8"?>\n'
+                  u'<tmx version="1.4">\n'
+                  u'<header creationtool="Gnotran" creationtoolversion="1" datatype="plaintext" '
+                  u'segtype="sentence" adminlang="en" srclang="*all*" o-tmf="Gnotran"/>\n'
+                  u'<body>\n')
+        for c_from, c_to, source, target in memory_rows(memory, pairs):
+            out.write(u'<tu>\n<tuv xml:lang=%s><seg>%s</seg></tuv>\n'
+                      u'<tuv xml:lang=%s><seg>%s</seg></tuv>\n</tu>\n' % (
+                          quoteattr(c_from), escape(source), quoteattr(c_to), escape(target)))
+            stats.entries += 1
+        out.write(u'</body>\n</tmx>\n')
+    stats.bytes = os.path.getsize(path)
+    stats.finish()
+    return stats
+
+
+def export_tsv(memory, path, c_from, c_to):
+    ''' Write the entries for c_from -> c_to as "line<TAB>translation"
+    rows.  Returns TransferStats. '''
+    stats = TransferStats()
+    with open(path, 'wb') as out:
+        for row in memory_rows(memory, [(c_from, c_to)]):
+            out.write('%s\t%s\n' % tuple(escape_tsv(field).encode('utf-8') for field in row[2:]))
+            stats.entries += 1
+    stats.bytes = os.path.getsize(path)
+    stats.finish()
+    return stats
+
+
+def import_file(memory, path, pairs=None, progress=None):
+    ''' Import a .tmx or .tsv file; a TSV file needs exactly one pair '''
+    if path.lower().endswith('.tmx'):
+        return import_tmx(memory, path, pairs, progress)
+    if not pairs or len(pairs) != 1:
+        raise ValueError('a TSV file holds one language pair')
+    c_from, c_to = pairs[0]
+    return import_tsv(memory, path, c_from, c_to, progress)
+
+
+def export_file(memory, path, pairs=None):
+    ''' Export to a .tmx or .tsv file; a TSV file needs exactly one pair '''
+    if path.lower().endswith('.tmx'):
+        return export_tmx(memory, path, pairs)
+    if not pairs or len(pairs) != 1:
+        raise ValueError('a TSV file holds one language pair')
+    c_from, c_to = pairs[0]
+    return export_tsv(memory, path, c_from, c_to)
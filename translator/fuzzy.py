@@ -0,0 +1,131 @@
+'''
+Fuzzy matching of lines against the translation memory.
+
+Lines are compared as sets of lowercase words, with every number taken
+as the same word, so lines that differ only in a number, a name or
+punctuation are near duplicates.  Similarity is the Jaccard index of the
+two sets.  The index only maps words to the ids of the lines containing
+them; a query looks up its rarest words only (prefix filtering): a line
+at least `threshold` similar must share one of them.  More words are
+looked up while they are cheap, and a line must then share enough of
+them to be a candidate at all.
+'''
+
+import math
+import re
+from array import array
+
+
+FUZZY_THRESHOLD = 0.7
+# words found in up to this many lines are looked up even when not needed
+CHEAP_WORD = 4096
+
+WORD = re.compile(r'\w+', re.UNICODE)
+NUMBER = re.compile(r'\d+(?:[.,]\d+)*', re.UNICODE)
+
+
+def tokens(line):
+    ''' Set of words of a line, numbers replaced by "#" '''
+    return set(u'#' if word.isdigit() else word for word in WORD.findall(line.lower()))
+
+
+def similarity(a, b):
+    ''' Jaccard index of two token sets '''
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return float(common) / (len(a) + len(b) - common)
+
+
+def adapt(line, source, target):
+    ''' Translation of line from a match (source, target).
+
+    When line and source differ only in numbers, and every number of
+    source is found once in target, the numbers of line are put into
+    target.  Otherwise target is returned as is.
+    '''
+    new = NUMBER.findall(line)
+    old = NUMBER.findall(source)
+    if new == old or len(new) != len(old):
+        return target
+    if NUMBER.sub(u'#', line) != NUMBER.sub(u'#', source):
+        return target
+    mapping = dict(zip(old, new))
+    if len(mapping) != len(old) or len(set(new)) != len(new):
+        return target
+    if any(len(re.findall(r'(?<![\d.,])%s(?![\d])' % re.escape(number), target)) != 1
+           for number in old):
+        return target
+    return NUMBER.sub(lambda m: mapping.get(m.group(0), m.group(0)), target)
+
+
+class FuzzyIndex(object):
+    ''' Inverted index from words to line ids, one per language pair.
+
+    Ids are chosen by the caller (TranslationMemory uses SQLite rowids).
+    candidates() returns ids that may be similar enough; the caller
+    checks them against the real lines.  Removed ids are skipped, but
+    their postings stay until the index is built anew: see wasteful().
+    '''
+
+    def __init__(self):
+        self._postings = {}
+        # number of words of every id, 0 for none or removed
+        self._sizes = array('H')
+        self.live = 0
+        self.removed = 0
+
+    def add(self, pair, id, words):
+        postings = self._postings.setdefault(pair, {})
+        for word in words:
+            ids = postings.get(word)
+            if ids is None:
+                ids = postings[word] = array('I')
+            ids.append(id)
+        if id >= len(self._sizes):
+            self._sizes.extend([0] * (id + 1 - len(self._sizes)))
+        if words and not self._sizes[id]:
+            self.live += 1
+        self._sizes[id] = min(len(words), 0xffff)
+
+    def remove(self, id):
+        ''' Forget the line with the id '''
+        if id < len(self._sizes) and self._sizes[id]:
+            self._sizes[id] = 0
+            self.live -= 1
+            self.removed += 1
+
+    def wasteful(self):
+        ''' True when postings of removed lines, or sizes of unused ids,
+        take more room than the lines in the index '''
+        return self.removed > self.live or len(self._sizes) > 2 * self.live + CHEAP_WORD
+
+    def candidates(self, pair, words, threshold=FUZZY_THRESHOLD):
+        ''' Ids of lines that may have similarity of at least threshold
+        with words '''
+        postings = self._postings.get(pair)
+        n = len(words)
+        if not postings or not n:
+            return set()
+        ordered = sorted(words, key=lambda word: len(postings.get(word, ())))
+        # any line with enough words in common has one of the first ones
+        probed = n - int(math.ceil(threshold * n - 1e-9)) + 1
+        while probed < n and len(postings.get(ordered[probed], ())) <= CHEAP_WORD:
+            probed += 1
+        low = threshold * n
+        high = n / threshold
+        sizes = self._sizes
+        hits = {}
+        for word in ordered[:probed]:
+            for id in postings.get(word, ()):
+                if sizes[id] and low <= sizes[id] <= high:
+                    hits[id] = hits.get(id, 0) + 1
+        # similarity >= threshold needs this many common words, the words
+        # not looked up can give at most n - probed of them
+        share = threshold / (1 + threshold)
+        left = n - probed
+        return set(id for id, count in hits.iteritems()
+                   if count + left >= share * (n + sizes[id]) - 1e-9)
+
+    def __len__(self):
+        return self.live
@@ -0,0 +1,132 @@
+'''
+Latency-aware failover between translator backends.
+
+HedgedBackend sends every batch to the fastest healthy backend.  If the
+answer is late (slower than that backend's usual 95th percentile), a
+duplicate request goes to the next backend and the first good answer
+wins.  A failed request is retried on the next backend at once.
+'''
+
+import threading
+import time
+from collections import deque
+
+from backends import Backend, TranslationError
+from pool import ThreadPool
+
+
+# requests remembered for every backend
+WINDOW = 100
+# samples needed before percentiles are trusted
+MIN_SAMPLES = 10
+# hedge delay until there are enough samples, seconds
+DEFAULT_DELAY = 1.0
+# a backend failing more often than this is unhealthy
+MAX_ERROR_RATE = 0.5
+
+
+class Served(list):
+    ''' Translations of a batch and the name of the backend that made them '''
+
+    def __init__(self, translations, backend):
+        list.__init__(self, translations)
+        self.backend = backend
+
+
+class LatencyTracker(object):
+    ''' Rolling latencies and errors of one backend '''
+
+    def __init__(self, window=WINDOW):
+        self._latencies = deque(maxlen=window)
+        self._results = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._results.append(ok)
+            if ok:
+                self._latencies.append(latency)
+
+    def percentile(self, p, default=None):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < MIN_SAMPLES:
+            return default
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+    def error_rate(self):
+        with self._lock:
+            if not self._results:
+                return 0.0
+            return 1 - float(sum(self._results)) / len(self._results)
+
+    def healthy(self):
+        return self.error_rate() < MAX_ERROR_RATE
+
+
+class HedgedBackend(Backend):
+    ''' Backend sending each batch to the best of several backends '''
+
+    name = 'Auto'
+
+    def __init__(self, backends, workers=4):
+        Backend.__init__(self, backends[0].http, backends[0].max_lines, backends[0].max_chars)
+        self.members = backends
+        self.trackers = dict((backend.name, LatencyTracker()) for backend in backends)
+        self._pool = ThreadPool(workers * len(backends), 'hedge')
+
+    def cost(self, line):
+        return max(backend.cost(line) for backend in self.members)
+
+    def limit(self):
+        return min(backend.limit() for backend in self.members)
+
+    def ranked(self):
+        ''' Backends by health, then by median latency '''
+        def rank(backend):
+            tracker = self.trackers[backend.name]
+            return (not tracker.healthy(), tracker.percentile(50, 0))
+        return sorted(self.members, key=rank)
+
+    def _timed(self, backend, lines, c_from, c_to):
+        started = time.time()
+        try:
+            translations = backend.request(lines, c_from, c_to)
+        except Exception:
+            self.trackers[backend.name].record(time.time() - started, False)
+            raise
+        self.trackers[backend.name].record(time.time() - started, True)
+        return Served(translations, backend.name)
+
+    def request(self, lines, c_from, c_to):
+        candidates = self.ranked()
+        running = []
+        finished = threading.Event()
+        deadline = None
+        error = None
+        while candidates or running:
+            # start the next backend if nothing runs or the running one is late
+            if candidates and (not running or time.time() >= deadline):
+                backend = candidates.pop(0)
+                future = self._pool.submit(self._timed, backend, lines, c_from, c_to)
+                future.add_done_callback(lambda future: finished.set())
+                running.append(future)
+                deadline = time.time() + self.trackers[backend.name].percentile(95, DEFAULT_DELAY)
+
+            for future in [future for future in running if future.done()]:
+                running.remove(future)
+                try:
+                    return future.result()
+                except Exception, e:
+                    error = e
+
+            if running:
+                timeout = None
+                if candidates:
+                    timeout = max(deadline - time.time(), 0)
+                finished.wait(timeout)
+                finished.clear()
+
+        if isinstance(error, TranslationError):
+            raise error
+        raise TranslationError('no backend answered: %s' % error)
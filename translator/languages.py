@@ -0,0 +1,103 @@
+'''
+Languages known to the translators: name -> code.
+'''
+
+LANGUAGES = {
+    'afrikaans':'af',
+    'albanian':'sq',
+    'amharic':'am',
+    'arabic':'ar',
+    'armenian':'hy',
+    'azerbaijani':'az',
+    'basque':'eu',
+    'belarusian':'be',
+    'bengali':'bn',
+    'bihari':'bh',
+    'bulgarian':'bg',
+    'burmese':'my',
+    'catalan':'ca',
+    'cherokee':'chr',
+    'chinese':'zh',
+    'chinese_simplified':'zh-cn',
+    'chinese_traditional':'zh-tw',
+    'croatian':'hr',
+    'czech':'cs',
+    'danish':'da',
+    'dhivehi':'dv',
+    'dutch':'nl',
+    'english':'en',
+    'esperanto':'eo',
+    'estonian':'et',
+    'filipino':'tl',
+    'finnish':'fi',
+    'french':'fr',
+    'galician':'gl',
+    'georgian':'ka',
+    'german':'de',
+    'greek':'el',
+    'guarani':'gn',
+    'gujarati':'gu',
+    'hebrew':'iw',
+    'hindi':'hi',
+    'hungarian':'hu',
+    'icelandic':'is',
+    'indonesian':'id',
+    'inuktitut':'iu',
+    'italian':'it',
+    'japanese':'ja',
+    'kannada':'kn',
+    'kazakh':'kk',
+    'khmer':'km',
+    'korean':'ko',
+    'kurdish':'ku',
+    'kyrgyz':'ky',
+    'laothian':'lo',
+    'latvian':'lv',
+    'lithuanian':'lt',
+    'macedonian':'mk',
+    'malay':'ms',
+    'malayalam':'ml',
+    'maltese':'mt',
+    'marathi':'mr',
+    'mongolian':'mn',
+    'nepali':'ne',
+    'norwegian':'no',
+    'oriya':'or',
+    'pashto':'ps',
+    'persian':'fa',
+    'polish':'pl',
+    'portuguese':'pt-pt',
+    'punjabi':'pa',
+    'romanian':'ro',
+    'russian':'ru',
+    'sanskrit':'sa',
+    'serbian':'sr',
+    'sindhi':'sd',
+    'sinhalese':'si',
+    'slovak':'sk',
+    'slovenian':'sl',
+    'spanish':'es',
+    'swahili':'sw',
+    'swedish':'sv',
+    'tajik':'tg',
+    'tamil':'ta',
+    'tagalog':'tl',
+    'telugu':'te',
+    'thai':'th',
+    'tibetan':'bo',
+    'turkish':'tr',
+    'ukrainian':'uk',
+    'urdu':'ur',
+    'uzbek':'uz',
+    'uighur':'ug',
+    'vietnamese':'vi',
+}
+
+
+def language_code(language):
+    ''' Code of a language given by name or by code '''
+    if language in LANGUAGES:
+        return LANGUAGES[language]
+    if language in LANGUAGES.values():
+        return language
+    raise KeyError(language)
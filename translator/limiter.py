@@ -0,0 +1,82 @@
+'''
+Adaptive concurrency limit for requests to one translator (AIMD).
+
+The limit grows by about one request per round of successful requests
+and is halved on an error, a throttling answer or a latency spike.  An
+optional requests-per-second ceiling spaces the requests out.
+'''
+
+import threading
+import time
+
+
+# statuses of a server asking us to slow down
+THROTTLE_STATUSES = (429, 503)
+# a request slower than this many times the average is a spike
+SPIKE_FACTOR = 3.0
+# weight of a new latency in the moving average
+SMOOTHING = 0.2
+
+
+class AdaptiveLimiter(object):
+    ''' Concurrency limit between minimum and maximum requests, starting at
+    initial, and at most rps requests per second (None or 0: no ceiling).
+
+    Every request takes a slot with acquire() and gives it back with
+    release(), telling how long it took and whether it succeeded.
+    '''
+
+    def __init__(self, initial=2, minimum=1, maximum=16, rps=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.rps = rps
+        self.in_flight = 0
+        self.latency = None
+        self.decreases = 0
+        self._next_start = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        ''' Wait for a free slot and for the rate ceiling '''
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            delay = 0
+            if self.rps:
+                now = time.time()
+                start = max(now, self._next_start)
+                self._next_start = start + 1.0 / self.rps
+                delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, latency, ok=True, status=None):
+        ''' Free the slot and adapt the limit to the result of the request '''
+        with self._cond:
+            self.in_flight -= 1
+            spike = self.latency is not None and latency > self.latency * SPIKE_FACTOR
+            if not ok or status in THROTTLE_STATUSES or spike:
+                self._decrease()
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            if ok:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += SMOOTHING * (latency - self.latency)
+            self._cond.notify_all()
+
+    def _decrease(self):
+        # at most once per average round trip, one bad burst is one signal
+        now = time.time()
+        if now - self._last_decrease < (self.latency or 0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        self.decreases += 1
+
+    def __str__(self):
+        return '%d' % int(self.limit)
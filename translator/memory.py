@@ -0,0 +1,237 @@
+'''
+Persistent translation memory.
+
+Translated lines are stored in SQLite, keyed by
+(api, c_from, c_to, normalized line), so the same line never goes over
+the network twice.  Entries imported from other tools have api "*" and
+are used for every translator that has no entry of its own, and are
+never evicted: the limits on age and number of entries only apply to
+what the translators stored.
+'''
+
+import sqlite3
+import threading
+import time
+
+from fuzzy import FuzzyIndex, FUZZY_THRESHOLD, tokens, similarity
+
+
+MAX_ENTRIES = 200000
+MAX_AGE_DAYS = 180
+
+# api of imported entries
+ANY_API = '*'
+
+# run eviction after this many new entries
+EVICT_EVERY = 1000
+# entries read at a time while the fuzzy index is built
+INDEX_CHUNK = 10000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS segments (
+    api TEXT NOT NULL,
+    c_from TEXT NOT NULL,
+    c_to TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (api, c_from, c_to, source)
+);
+CREATE INDEX IF NOT EXISTS segments_used ON segments (used);
+'''
+
+
+def normalize(line):
+    ''' Key of a line: surrounding and repeated whitespace removed '''
+    return u' '.join(line.split())
+
+
+class TranslationMemory(object):
+    ''' SQLite store of translated lines, safe to share between threads '''
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._added = 0
+        self._lock = threading.Lock()
+        # built on the first fuzzy lookup, by one thread at a time
+        self._fuzzy = None
+        self._build_lock = threading.Lock()
+        # while it is built: the last rowid read, and changes to rows read
+        self._scanned = None
+        self._changes = []
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self.evict()
+
+    def get_many(self, api, c_from, c_to, lines):
+        ''' Return {line: translation} for the lines found in memory '''
+        found = {}
+        now = time.time()
+        with self._lock:
+            for line in set(lines):
+                # the translator's own entry first, then an imported one
+                row = self._db.execute(
+                    'SELECT api, target FROM segments WHERE api IN (?, ?) AND c_from=? AND c_to=? '
+                    'AND source=? ORDER BY api=? LIMIT 1',
+                    (api, ANY_API, c_from, c_to, normalize(line), ANY_API)).fetchone()
+                if row is None:
+                    continue
+                found[line] = row[1]
+                self._db.execute(
+                    'UPDATE segments SET used=? WHERE api=? AND c_from=? AND c_to=? AND source=?',
+                    (now, row[0], c_from, c_to, normalize(line)))
+            self._db.commit()
+            hits = sum(1 for line in lines if line in found)
+            self.hits += hits
+            self.misses += len(lines) - hits
+        return found
+
+    def put_many(self, api, c_from, c_to, pairs):
+        ''' Store (line, translation) pairs '''
+        now = time.time()
+        rows = [(api, c_from, c_to, normalize(line), translation, now)
+                for line, translation in pairs if translation]
+        with self._lock:
+            self._write(rows)
+            self._db.commit()
+            self._added += len(rows)
+            if self._added < EVICT_EVERY:
+                return
+        self.evict()
+
+    def put_rows(self, api, rows):
+        ''' Store (c_from, c_to, line, translation) rows in one
+        transaction, for bulk import.  Returns the
+        number of entries stored: of rows with the same line, the last. '''
+        now = time.time()
+        unique = {}
+        for c_from, c_to, line, translation in rows:
+            if line.strip() and translation:
+                key = (c_from, c_to, normalize(line))
+                unique[key] = (api, c_from, c_to, key[2], translation, now)
+        rows = unique.values()
+        with self._lock:
+            self._write(rows)
+            self._db.commit()
+        return len(rows)
+
+    def _write(self, rows):
+        ''' Insert or replace rows, and keep the fuzzy index up to date;
+        with the lock held '''
+        if self._fuzzy is None and self._scanned is None:
+            self._db.executemany('INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return
+        for row in rows:
+            # an update keeps the rowid, and the words of the line are the same
+            cursor = self._db.execute(
+                'UPDATE segments SET target=?, used=? WHERE api=? AND c_from=? AND c_to=? AND source=?',
+                row[4:] + row[:4])
+            if cursor.rowcount == 0:
+                cursor = self._db.execute('INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?)', row)
+                self._index(cursor.lastrowid, (row[1], row[2]), tokens(row[3]))
+
+    def _index(self, rowid, pair=None, words=None):
+        ''' Add a row to the fuzzy index, or remove it without a pair;
+        while the index is built, keep the change for it if it has read
+        past the row.  With the lock held '''
+        if self._fuzzy is not None:
+            if pair is None:
+                self._fuzzy.remove(rowid)
+            else:
+                self._fuzzy.add(pair, rowid, words)
+        elif self._scanned is not None and rowid <= self._scanned:
+            self._changes.append((rowid, pair, words))
+
+    def _fuzzy_index(self):
+        ''' The fuzzy index, built on first use.  Entries are read a chunk
+        at a time and indexed without the lock, so translations can use
+        the memory meanwhile. '''
+        with self._build_lock:
+            with self._lock:
+                if self._fuzzy is not None:
+                    return self._fuzzy
+                self._scanned = 0
+                self._changes = []
+            index = FuzzyIndex()
+            while True:
+                with self._lock:
+                    rows = self._db.execute(
+                        'SELECT rowid, c_from, c_to, source FROM segments WHERE rowid > ? '
+                        'ORDER BY rowid LIMIT ?', (self._scanned, INDEX_CHUNK)).fetchall()
+                    if not rows:
+                        # done: apply what changed in the rows read meanwhile
+                        self._fuzzy = index
+                        changes, self._changes, self._scanned = self._changes, [], None
+                        for change in changes:
+                            self._index(*change)
+                        return index
+                    self._scanned = rows[-1][0]
+                for rowid, row_from, row_to, source in rows:
+                    index.add((row_from, row_to), rowid, tokens(source))
+
+    def fuzzy_many(self, c_from, c_to, lines, threshold=FUZZY_THRESHOLD, limit=3):
+        ''' Return {line: [(similarity, source, target), ...]} with up to
+        limit stored lines of any translator at least threshold similar
+        to every line, best first.  Lines without matches are left out.
+        The index is built on the first call, which reads all entries.
+        '''
+        index = self._fuzzy_index()
+        found = {}
+        for line in set(lines):
+            words = tokens(line)
+            ids = list(index.candidates((c_from, c_to), words, threshold))
+            rows = []
+            # stay under the SQLite limit of query parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                with self._lock:
+                    rows.extend(self._db.execute(
+                        'SELECT source, target FROM segments WHERE c_from=? AND c_to=? '
+                        'AND rowid IN (%s)' % ','.join('?' * len(chunk)),
+                        [c_from, c_to] + chunk))
+            matches = {}
+            for source, target in rows:
+                score = similarity(words, tokens(source))
+                if score >= threshold:
+                    matches[source] = (score, source, target)
+            if matches:
+                found[line] = sorted(matches.values(), reverse=True)[:limit]
+        return found
+
+    def evict(self):
+        ''' Remove entries of the translators not used for max_age
+        seconds, then the least recently used ones above max_entries.
+        Imported entries are kept. '''
+        oldest = time.time() - self.max_age
+        with self._lock:
+            self._added = 0
+            doomed = [rowid for rowid, in self._db.execute(
+                'SELECT rowid FROM segments WHERE api != ? AND used < ?', (ANY_API, oldest))]
+            count = self._db.execute('SELECT COUNT(*) FROM segments WHERE api != ?',
+                                     (ANY_API,)).fetchone()[0] - len(doomed)
+            if count > self.max_entries:
+                doomed.extend(rowid for rowid, in self._db.execute(
+                    'SELECT rowid FROM segments WHERE api != ? AND used >= ? ORDER BY used LIMIT ?',
+                    (ANY_API, oldest, count - self.max_entries)))
+            for start in range(0, len(doomed), 500):
+                chunk = doomed[start:start + 500]
+                self._db.execute('DELETE FROM segments WHERE rowid IN (%s)' % ','.join('?' * len(chunk)),
+                                 chunk)
+                for rowid in chunk:
+                    self._index(rowid)
+            self._db.commit()
+            if self._fuzzy is not None and self._fuzzy.wasteful():
+                # built anew, without the removed lines, on the next lookup
+                self._fuzzy = None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,185 @@
+'''
+Metrics of outbound HTTP calls.
+
+Every call made through a ConnectionPool (and by the Wordnik client) is
+recorded as a Call: backend, endpoint, bytes out and in, status, time
+spent waiting for a free slot and latency.  The Recorder keeps latency
+and wait histograms per backend and passes every call to its observers,
+e.g. a JsonLinesExporter.  `recorder` is the one used by default.
+'''
+
+import bisect
+import json
+import threading
+import time
+
+
+# histogram buckets: upper bounds from 1 ms up by a factor of 2 ** 0.25
+BOUNDS = [0.001 * 2 ** (i / 4.0) for i in range(80)]
+
+
+class Call(object):
+    ''' One HTTP call '''
+
+    __slots__ = ('backend', 'endpoint', 'bytes_out', 'bytes_in', 'status',
+                 'wait', 'latency', 'started', 'error')
+
+    def __init__(self, backend, endpoint, bytes_out=0, bytes_in=0, status=None,
+                 wait=0.0, latency=0.0, started=None, error=None):
+        self.backend = backend
+        self.endpoint = endpoint
+        self.bytes_out = bytes_out
+        self.bytes_in = bytes_in
+        # None when there was no response at all
+        self.status = status
+        self.wait = wait
+        self.latency = latency
+        self.started = started or time.time()
+        self.error = error
+
+    def ok(self):
+        return self.status == 200
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class Histogram(object):
+    ''' Counts of values in logarithmic buckets; percentiles are accurate
+    to about 20% '''
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, p):
+        ''' Upper bound of the bucket holding the p-th percentile '''
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if bucket < len(BOUNDS):
+                    return min(BOUNDS[bucket], self.max)
+                break
+        return self.max
+
+
+class BackendMetrics(object):
+    ''' Totals and histograms of the calls to one backend '''
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latency = Histogram()
+        self.wait = Histogram()
+        self.statuses = {}
+
+    def add(self, call):
+        self.calls += 1
+        if not call.ok():
+            self.errors += 1
+        self.bytes_out += call.bytes_out
+        self.bytes_in += call.bytes_in
+        self.latency.add(call.latency)
+        self.wait.add(call.wait)
+        self.statuses[call.status] = self.statuses.get(call.status, 0) + 1
+
+
+class Recorder(object):
+    ''' Collect Calls into per-backend metrics and pass them on to
+    observers, callables taking a Call '''
+
+    def __init__(self):
+        self.backends = {}
+        self._observers = []
+        self._lock = threading.Lock()
+
+    def add_observer(self, observer):
+        with self._lock:
+            self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        with self._lock:
+            if observer in self._observers:
+                self._observers.remove(observer)
+
+    def call(self, backend, endpoint, bytes_out=0):
+        ''' New Call to fill in and record(), for clients that do not
+        import this module '''
+        return Call(backend, endpoint, bytes_out)
+
+    def record(self, call):
+        with self._lock:
+            metrics = self.backends.get(call.backend)
+            if metrics is None:
+                metrics = self.backends[call.backend] = BackendMetrics()
+            metrics.add(call)
+            observers = list(self._observers)
+        for observer in observers:
+            try:
+                observer(call)
+            except Exception:
+                # a broken observer must not break the calls
+                self.remove_observer(observer)
+
+    def summary(self):
+        ''' {backend: dict of totals and latency percentiles in seconds} '''
+        with self._lock:
+            return dict((backend, {'calls': m.calls,
+                                   'errors': m.errors,
+                                   'bytes_out': m.bytes_out,
+                                   'bytes_in': m.bytes_in,
+                                   'p50': m.latency.percentile(50),
+                                   'p95': m.latency.percentile(95),
+                                   'p99': m.latency.percentile(99),
+                                   'wait_p95': m.wait.percentile(95)})
+                        for backend, m in self.backends.items())
+
+    def reset(self):
+        with self._lock:
+            self.backends = {}
+
+    def __str__(self):
+        return '; '.join('%s: %d calls, %d errors, p50 %.0f ms, p95 %.0f ms' % (
+            backend, s['calls'], s['errors'], s['p50'] * 1000, s['p95'] * 1000)
+            for backend, s in sorted(self.summary().items()))
+
+
+class JsonLinesExporter(object):
+    ''' Observer writing every call as one JSON object per line '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def __call__(self, call):
+        line = json.dumps(call.as_dict()) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+recorder = Recorder()
@@ -0,0 +1,103 @@
+'''
+A small fixed-size thread pool for translator requests.
+'''
+
+import Queue
+import threading
+
+import profiling
+
+
+class Future(object):
+    ''' Result of a call running in the pool '''
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_error(self, error):
+        self._error = error
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        ''' Call callback(future) when the call is finished '''
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        ''' Wait for the call, return True if it is finished '''
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        ''' Wait for the call and return its result or raise its error '''
+        self._done.wait(timeout)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class ThreadPool(object):
+    ''' Run calls in at most `workers` background threads '''
+
+    def __init__(self, workers, name='translator'):
+        # at least one, or submitted calls would never run
+        self.workers = max(1, workers)
+        self._queue = Queue.Queue()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name='%s-%d' % (name, i))
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        profile = None
+        while True:
+            future, func, args = self._queue.get()
+            if profile is None and profiling.enabled():
+                profile = profiling.ThreadProfile(threading.current_thread().name)
+            try:
+                if profile is None:
+                    future.set_result(func(*args))
+                else:
+                    future.set_result(profile.runcall(func, *args))
+            except Exception, e:
+                future.set_error(e)
+
+    def submit(self, func, *args):
+        ''' Queue func(*args), return its Future '''
+        future = Future()
+        self._queue.put((future, func, args))
+        return future
+
+    def imap_unordered(self, func, items):
+        ''' Run func(item) for every item, yield (item, result) in order
+        of completion.  The error of the first failed call is raised. '''
+        finished = Queue.Queue()
+        count = 0
+        for item in items:
+            future = self.submit(func, item)
+            future.add_done_callback(lambda f, item=item: finished.put((item, f)))
+            count += 1
+        for i in range(count):
+            item, future = finished.get()
+            yield item, future.result()
@@ -0,0 +1,167 @@
+'''
+Opt-in profiling of background threads and startup.
+
+Profiling is on when the GNOTRAN_PROFILE environment variable names a
+directory, or after enable().  Every profiled piece of work then writes
+two files there, named after the time, the work and a counter:
+
+    *.pstats   cProfile statistics, for pstats.Stats or any viewer
+    *.txt      memory before and after, the object types that grew
+               most, and the functions that took most time
+
+Python 2 has no tracemalloc, so memory is measured as resident set size
+and as counts of live container objects by type (from gc).  Threads of
+a ThreadPool keep one profile each, written at most once a second.
+'''
+
+import atexit
+import cProfile
+import gc
+import itertools
+import os
+import pstats
+import resource
+import StringIO
+import threading
+import time
+
+
+PROFILE_ENV = 'GNOTRAN_PROFILE'
+# lines of the reports
+TOP = 25
+# pool threads write their profile at most this often, seconds
+DUMP_EVERY = 1.0
+
+directory = None
+_counter = itertools.count(1)
+# ThreadProfiles, written once more at exit
+_threads = []
+
+
+def enable(path):
+    ''' Write profiles to the directory path '''
+    global directory
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    directory = path
+
+
+def enabled():
+    return directory is not None
+
+
+def rss():
+    ''' Resident set size in bytes, or the peak one where /proc is missing '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, ValueError, IndexError):
+        # kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def object_counts():
+    ''' {type name: number of live container objects} '''
+    gc.collect()
+    counts = {}
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def report_path(name, extension):
+    return os.path.join(directory, '%s-%s-%d.%s' % (
+        time.strftime('%Y%m%d-%H%M%S'), name, next(_counter), extension))
+
+
+class Profile(object):
+    ''' cProfile of one piece of work in the current thread, with memory
+    snapshots before and after '''
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.rss = rss()
+        self.objects = object_counts()
+        self.started = time.time()
+        self.profile.enable()
+
+    def stop(self):
+        ''' Stop and write the reports, return the path of the pstats file '''
+        self.profile.disable()
+        elapsed = time.time() - self.started
+        rss_after = rss()
+        objects = object_counts()
+
+        path = report_path(self.name, 'pstats')
+        self.profile.dump_stats(path)
+        growth = sorted(((objects.get(name, 0) - self.objects.get(name, 0), name)
+                         for name in set(objects) | set(self.objects)), reverse=True)
+        with open(path[:-len('pstats')] + 'txt', 'wb') as f:
+            f.write('work: %s\nthread: %s\nseconds: %.3f\n' % (
+                self.name, threading.current_thread().name, elapsed))
+            f.write('rss before: %.1f MB\nrss after: %.1f MB (%+.1f MB)\n\n' % (
+                self.rss / 2.0 ** 20, rss_after / 2.0 ** 20, (rss_after - self.rss) / 2.0 ** 20))
+            f.write('objects that grew most (type: before -> after)\n')
+            for change, name in growth[:TOP]:
+                if change <= 0:
+                    break
+                f.write('%-30s %9d -> %9d  %+d\n' % (
+                    name, self.objects.get(name, 0), objects.get(name, 0), change))
+            f.write('\n')
+            stream = StringIO.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats('cumulative').print_stats(TOP)
+            f.write(stream.getvalue())
+        return path
+
+
+def profiled(name, func):
+    ''' func, profiled on every call while profiling is enabled; for
+    targets of worker threads '''
+    def wrapper(*args, **kwargs):
+        if directory is None:
+            return func(*args, **kwargs)
+        profile = Profile(name)
+        profile.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.stop()
+    return wrapper
+
+
+class ThreadProfile(object):
+    ''' One profile of all the calls run by a long-lived thread '''
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.path = None
+        self._dumped = 0
+        _threads.append(self)
+
+    def runcall(self, func, *args):
+        try:
+            return self.profile.runcall(func, *args)
+        finally:
+            if time.time() - self._dumped >= DUMP_EVERY:
+                self.dump()
+
+    def dump(self):
+        # the same file every time, with all calls so far
+        self.path = self.path or report_path(self.name, 'pstats')
+        self.profile.dump_stats(self.path)
+        self._dumped = time.time()
+
+
+@atexit.register
+def _dump_threads():
+    for profile in _threads:
+        profile.dump()
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV])
@@ -0,0 +1,87 @@
+'''
+Splitting of long lines into pieces that fit into one request.
+
+A line is cut at sentence ends first, then between words, and only a
+word longer than the limit is cut inside.  Whitespace around and
+between the pieces is kept, so join() restores the line structure.
+'''
+
+import re
+
+
+SENTENCE_END = re.compile(ur'(?<=[.!?\u2026\u3002])(\s+)', re.UNICODE)
+WORD_SPACE = re.compile(ur'(\s+)', re.UNICODE)
+
+
+def _with_separators(parts, last):
+    ''' [text, sep, text, sep, text] -> [(text, sep), ..., (text, last)] '''
+    return zip(parts[0::2], parts[1::2] + [last])
+
+
+def _cut(word, limit, cost):
+    ''' Cut a word into chunks of at most limit cost '''
+    start = 0
+    while start < len(word):
+        end = start + 1
+        while end < len(word) and cost(word[start:end + 1]) <= limit:
+            end += 1
+        yield word[start:end]
+        start = end
+
+
+def _units(text, limit, cost):
+    ''' (unit, separator) pairs: sentences, words of too long sentences
+    and chunks of too long words '''
+    for sentence, sep in _with_separators(SENTENCE_END.split(text), u''):
+        if cost(sentence) <= limit:
+            yield sentence, sep
+            continue
+        for word, word_sep in _with_separators(WORD_SPACE.split(sentence), sep):
+            if cost(word) <= limit:
+                yield word, word_sep
+                continue
+            chunks = list(_cut(word, limit, cost))
+            for chunk in chunks[:-1]:
+                yield chunk, u''
+            yield chunks[-1], word_sep
+
+
+def split(line, limit, cost=len):
+    ''' Split line into pieces of at most limit cost.
+
+    Returns (pieces, glue): glue holds the whitespace before the first
+    piece, between the pieces and after the last one, so
+    join(pieces, glue) == line.  A blank line has no pieces.
+    '''
+    text = line.strip()
+    if not text:
+        return [], [line]
+    start = line.index(text[0])
+    lead, trail = line[:start], line[start + len(text):]
+
+    pieces = []
+    glue = [lead]
+    piece = u''
+    gap = u''
+    for unit, sep in _units(text, limit, cost):
+        if piece and cost(piece + gap + unit) > limit:
+            pieces.append(piece)
+            glue.append(gap)
+            piece = unit
+        elif piece:
+            piece = piece + gap + unit
+        else:
+            piece = unit
+        gap = sep
+    pieces.append(piece)
+    glue.append(trail)
+    return pieces, glue
+
+
+def join(pieces, glue):
+    ''' Inverse of split() '''
+    parts = [glue[0]]
+    for piece, sep in zip(pieces, glue[1:]):
+        parts.append(piece)
+        parts.append(sep)
+    return u''.join(parts)
@@ -0,0 +1,54 @@
+'''
+Single-flight: one request per key at a time.
+
+When several callers need the same segment at once, the first one
+becomes its leader and sends it; the others wait for the leader's
+result instead of sending their own copy.
+'''
+
+import threading
+
+from pool import Future
+
+
+class SingleFlight(object):
+    ''' Keys in flight and the Futures of their results.
+
+    claim() makes the caller the leader of the keys nobody sends yet.
+    The leader must end every key it leads, with resolve() once it has
+    the result or with fail() if the request failed; the Futures of the
+    other callers are set then, and the key can be claimed again.
+    '''
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def claim(self, keys):
+        ''' Split keys into those the caller must send ({key: Future})
+        and those already in flight ({key: Future} to wait for) '''
+        leading = {}
+        waiting = {}
+        with self._lock:
+            for key in keys:
+                if key in self._calls:
+                    waiting[key] = self._calls[key]
+                else:
+                    leading[key] = self._calls[key] = Future()
+        return leading, waiting
+
+    def resolve(self, key, result):
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future is not None:
+            future.set_result(result)
+
+    def fail(self, keys, error):
+        ''' Give the error to everybody waiting for keys '''
+        with self._lock:
+            futures = [self._calls.pop(key) for key in keys if key in self._calls]
+        for future in futures:
+            future.set_error(error)
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,176 @@
+'''
+Keep-alive HTTP connections shared by all translator requests, and by
+the Wordnik client of the dictionary.
+'''
+
+import httplib
+import socket
+import threading
+import time
+import urlparse
+
+import metrics
+
+
+PER_HOST = 4
+IDLE_TIMEOUT = 30
+
+# request line and headers sent by get(), for the metrics
+REQUEST = 'GET %s HTTP/1.1\r\nHost: %s\r\nAccept-Encoding: identity\r\nConnection: keep-alive\r\n\r\n'
+TIMEOUT = 30
+# methods sent again when a kept-alive connection turns out to be closed
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
+class HTTPError(IOError):
+    '''Raised when the server answers with a status other than 200.'''
+
+    def __init__(self, status, reason):
+        IOError.__init__(self, '%d %s' % (status, reason))
+        self.status = status
+
+
+class Response(object):
+    ''' Outcome of one call: status, reason, headers and body, and the
+    seconds spent waiting for a connection and on the call itself '''
+
+    def __init__(self, status, reason, headers, body, wait=0.0, latency=0.0):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.wait = wait
+        self.latency = latency
+
+    def ok(self):
+        return self.status == httplib.OK
+
+
+class ConnectionPool(object):
+    ''' Reuse HTTP connections between requests.
+
+    At most per_host connections are open to one host; further requests
+    wait for a free one.  Connections idle longer than idle_timeout
+    seconds are closed.  Every request is recorded in recorder
+    (metrics.recorder by default).
+    '''
+
+    def __init__(self, per_host=PER_HOST, idle_timeout=IDLE_TIMEOUT, timeout=TIMEOUT,
+                 recorder=None):
+        self.per_host = per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.recorder = recorder or metrics.recorder
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, host):
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._slots[host]
+
+    def _take(self, host):
+        ''' Idle connection to host or None '''
+        with self._lock:
+            self._evict(time.time())
+            idle = self._idle.get(host)
+            if idle:
+                return idle.pop()[0]
+        return None
+
+    def _give_back(self, host, conn):
+        with self._lock:
+            self._idle.setdefault(host, []).append((conn, time.time()))
+
+    def _evict(self, now):
+        for host, idle in self._idle.items():
+            fresh = []
+            for conn, used in idle:
+                if now - used > self.idle_timeout:
+                    conn.close()
+                else:
+                    fresh.append((conn, used))
+            self._idle[host] = fresh
+
+    def get(self, url, backend=None, waited=0.0):
+        ''' GET url and return the body of the response.
+
+        backend names the caller in the metrics, waited is the time it
+        already waited for its turn, seconds.
+        '''
+        parts = urlparse.urlsplit(url)
+        host = parts.netloc
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        call = metrics.Call(backend or host, host + (parts.path or '/'),
+                            len(REQUEST % (path, host)))
+        try:
+            response = self.request(host, 'GET', path)
+        except Exception, e:
+            call.wait = waited
+            call.latency = time.time() - call.started
+            call.error = repr(e)
+            self.recorder.record(call)
+            raise
+
+        call.wait = waited + response.wait
+        call.latency = response.latency
+        call.status = response.status
+        call.bytes_in = len(response.body)
+        self.recorder.record(call)
+        if response.status != httplib.OK:
+            raise HTTPError(response.status, response.reason)
+        return response.body
+
+    def request(self, host, method, path, body=None, headers=None):
+        ''' Make one call on a kept-alive connection and return its
+        Response, whatever the status.  Not recorded in the metrics. '''
+        started = time.time()
+        slot = self._slot(host)
+        slot.acquire()
+        try:
+            sent = time.time()
+            conn = self._take(host)
+            reused = conn is not None
+            if not reused:
+                conn = httplib.HTTPConnection(host, timeout=self.timeout)
+            try:
+                response, text = self._exchange(conn, method, path, body, headers)
+            except (httplib.HTTPException, socket.error):
+                if not reused or method not in IDEMPOTENT:
+                    raise
+                # the server closed the kept-alive connection, try a new one
+                conn = httplib.HTTPConnection(host, timeout=self.timeout)
+                response, text = self._exchange(conn, method, path, body, headers)
+            if response.will_close:
+                conn.close()
+            else:
+                self._give_back(host, conn)
+        finally:
+            slot.release()
+        return Response(response.status, response.reason, dict(response.getheaders()), text,
+                        sent - started, time.time() - sent)
+
+    def _exchange(self, conn, method, path, body, headers):
+        ''' Response and body of one request; the connection is closed
+        when it fails '''
+        headers = dict(headers or {})
+        headers.setdefault('Connection', 'keep-alive')
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            return response, response.read()
+        except:
+            conn.close()
+            raise
+
+    def close(self):
+        ''' Close all idle connections '''
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, used in idle:
+                    conn.close()
+            self._idle = {}
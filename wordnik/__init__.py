@@ -5,6 +5,6 @@ from wordnik import RestfulError, InvalidRelationType, NoAPIKey, MissingParamete
 # Globals
 from wordnik import DEFAULT_URL, DEFAULT_FORMAT
 
+# API methods are created on first use, from the index of compile_specs.py
 from wordnik import Wordnik
-Wordnik._populate_methods()
 
@@ -0,0 +1,23 @@
+"""Compile the endpoint specs into the method index of the Wordnik class.
+
+    python wordnik/compile_specs.py
+
+Parses every JSON file in "endpoints" once and writes endpoints.marshal,
+which the Wordnik class loads instead of the specs. Run it after changing
+the specs or when installing; a missing or stale index is rebuilt on the
+first method call instead.
+"""
+
+import time
+
+import wordnik
+
+def main():
+    started = time.time()
+    index = wordnik.build_index()
+    wordnik.write_index(index, wordnik.spec_signature())
+    print "{0} methods in {1} ({2:.1f} ms)".format(len(index), wordnik.INDEX_FILE,
+                                                  (time.time() - started) * 1000)
+
+if __name__ == "__main__":
+    main()
@@ -68,6 +68,23 @@ def get_required_params(params):
         required_params.append(p['name'])
     return required_params
       
+def spec_methods(jsn):
+    """(methodName, (path, HTTP method, params, docs)) of every operation
+    in the JSON spec of one endpoint file. Params keep only what
+    process_args uses, so the result is small and marshal-able."""
+    for method in jsn['endPoints']:
+        path = method['path']
+        for op in method['operations']:
+            params = []
+            for param in op['parameters']:
+                params.append(dict((key, param[key]) for key in
+                                   ('name', 'description', 'paramType', 'required') if key in param))
+            ## a path like: /user.{format}/{username}/wordOfTheDayList/{permalink} (GET)
+            ## will get translated into method: user_get_word_of_the_day_list
+            name = normalize(path, op['httpMethod'].lower())
+            docs = generate_docs(params, op['response'], op['summary'], path)
+            yield name, (path, op['httpMethod'].upper(), params, docs)
+
 def create_method(name, doc, params, path, httpmethod):
     """The magic behind the dynamically generated methods in the Wordnik object"""
     def _method(self, *args, **kwargs):
@@ -6,7 +6,7 @@ maintainer: Robin Walsh (robin@wordnik.com)
 """
 
 import helpers      ## helper functions for this module
-import httplib, os
+import httplib, marshal, os, tempfile, threading, time
 
 from optparse import OptionParser
 from xml.etree import ElementTree
@@ -25,6 +25,93 @@ FORMAT_JSON     = "json"
 FORMAT_XML      = "xml" 
 DEFAULT_FORMAT  = FORMAT_JSON
 
+## the API methods are described by the JSON specs in "endpoints"; they are
+## compiled into a marshal index (see compile_specs.py) and every method is
+## created on first use
+ENDPOINTS_DIR   = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endpoints")
+INDEX_FILE      = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endpoints.marshal")
+INDEX_VERSION   = 1
+
+_index = None
+
+def spec_signature():
+    """(file name, mtime, size) of every spec, to tell a stale index"""
+    signature = []
+    for filename in sorted(os.listdir(ENDPOINTS_DIR)):
+        if filename.endswith(".json"):
+            st = os.stat(os.path.join(ENDPOINTS_DIR, filename))
+            signature.append((filename, int(st.st_mtime), st.st_size))
+    return tuple(signature)
+
+def build_index():
+    """Parse the specs into {methodName: (path, HTTP method, params, docs)}"""
+    index = {}
+    for filename, mtime, size in spec_signature():
+        with open(os.path.join(ENDPOINTS_DIR, filename)) as f:
+            index.update(helpers.spec_methods(json.load(f)))
+    return index
+
+def write_index(index, signature, path=INDEX_FILE):
+    """Save the index for later imports, atomically"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump((INDEX_VERSION, signature, index), f)
+        os.rename(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+def method_index():
+    """The method index, loaded once. A missing or stale index file is
+    rebuilt from the specs and saved if the directory is writable."""
+    global _index
+    if _index is None:
+        signature = spec_signature()
+        index = None
+        try:
+            with open(INDEX_FILE, "rb") as f:
+                version, indexed, index = marshal.load(f)
+            if version != INDEX_VERSION or indexed != signature:
+                index = None
+        except (IOError, EOFError, ValueError, TypeError):
+            index = None
+        if index is None:
+            index = build_index()
+            try:
+                write_index(index, signature)
+            except (IOError, OSError):
+                pass
+        _index = index
+    return _index
+
+class SingleConnections(object):
+    """Default pool of a Wordnik object: a new connection for every
+    call, closed after it"""
+
+    def request(self, host, method, uri, body=None, headers=None):
+        started = time.time()
+        conn = httplib.HTTPConnection(host)
+        try:
+            conn.request(method, uri, body, headers or {})
+            response = conn.getresponse()
+            response.body = response.read()
+        finally:
+            conn.close()
+        response.wait = 0.0
+        response.latency = time.time() - started
+        return response
+
+class LazyMethods(type):
+    """Metaclass creating the API methods of a class on first access"""
+
+    def __getattr__(klass, name):
+        if name.startswith("__") or name not in method_index():
+            raise AttributeError(name)
+        path, httpmethod, params, docs = method_index()[name]
+        setattr(klass, name, helpers.create_method(name, docs, params, path, httpmethod))
+        return type.__getattribute__(klass, name)
+
 class RestfulError(Exception):
     """Raised when response from REST API indicates an error has occurred."""
 
@@ -38,6 +125,8 @@ class MissingParameters(Exception):
     """Raised if we try to call an API method with required parameters missing"""
     
 class Wordnik(object):
+
+    __metaclass__ = LazyMethods
     
     """
     A generic Wordnik object. Use me to interact with the Wordnik API.
@@ -65,7 +154,8 @@ class Wordnik(object):
     """
     
     
-    def __init__(self, api_key=None, username=None, password=None, beta=False):
+    def __init__(self, api_key=None, username=None, password=None, beta=False, pool=None,
+                 recorder=None):
         """
         Initialize a Wordnik object. You must pass in an API key when
         you make a new Wordnik. We don't validate the API key until the
@@ -75,6 +165,13 @@ class Wordnik(object):
         If you also pass in a username and password, we will try to get an
         auth token so you can use the Wordnik authenticated methods.
         Alternatively, you can call Wordnik.authenticate(user, pass)
+
+        Calls go through pool, anything with the request() method of
+        SingleConnections, e.g. a keep-alive connection pool; by default
+        every call has a connection of its own. Every call is recorded by
+        recorder, if given: recorder.call(backend, endpoint, bytes_out)
+        makes a call record, recorder.record(call) takes it back filled in.
+        A Wordnik object can be used by several threads at once.
         """
         
         if api_key is None:
@@ -85,8 +182,11 @@ class Wordnik(object):
         self.password = password
         self.token    = None
         self.beta     = beta
+        self.pool     = pool or SingleConnections()
+        self.recorder = recorder
 
-        self._http_code = None
+        ## the last Response of every thread
+        self._local   = threading.local()
         
         if username and password:
             try:
@@ -96,39 +196,39 @@ class Wordnik(object):
                 raise RestfulError("Could not authenticate with the given username and password")
         
         
+    @property
+    def last_response(self):
+        """The Response of the last call made by the current thread, or None"""
+        return getattr(self._local, "response", None)
+
+    @property
+    def _http_code(self):
+        """Status of the last call made by the current thread"""
+        response = self.last_response
+        return response.status if response is not None else None
+
+    def __getattr__(self, name):
+        ## not found on the instance or the class yet: an API method,
+        ## which the metaclass creates on the class
+        getattr(type(self), name)
+        return object.__getattribute__(self, name)
+
     @classmethod
     def _populate_methods(klass):
         """This will create all the methods we need to interact with
-        the Wordnik API"""
-        
-        ## there is a directory called "endpoints"
-        basedir = os.path.dirname(__file__)
-        for filename in os.listdir('{0}/endpoints'.format(basedir)):
-            j = json.load(open('{0}/endpoints/{1}'.format(basedir, filename)))
-            Wordnik._create_methods(j)
+        the Wordnik API at once, e.g. for dir() and help(). Otherwise
+        they are created on first use."""
+        for name in method_index():
+            getattr(klass, name)
             
     @classmethod
     def _create_methods(klass, jsn):
         """A helper method that will populate this module's namespace
         with methods (parsed directlly from the Wordnik API's output)
         """
-        endpoints = jsn['endPoints']
-    
-        for method in endpoints:
-            path = method['path']
-            for op in method['operations']:
-                summary = op['summary']
-                httpmethod = op['httpMethod']
-                params = op['parameters']
-                response = op['response']
-    
-                ## a path like: /user.{format}/{username}/wordOfTheDayList/{permalink} (GET)
-                ## will get translated into method: user_get_word_of_the_day_list
-                methodName  = helpers.normalize(path, httpmethod.lower())
-                docs        = helpers.generate_docs(params, response, summary, path)
-                method      = helpers.create_method(methodName, docs, params, path, httpmethod.upper())
-                
-                setattr( Wordnik, methodName, method )
+        for methodName, (path, httpmethod, params, docs) in helpers.spec_methods(jsn):
+            method = helpers.create_method(methodName, docs, params, path, httpmethod)
+            setattr( klass, methodName, method )
     
     def _run_command(self, command_name, *args, **kwargs):
         if 'api_key' not in kwargs:
@@ -200,21 +300,38 @@ class Wordnik(object):
         if body:
             headers.update( {"Content-Type": "application/json"})
 
-        ## make the HTTP connection (to the right host)
+        ## make the HTTP call (to the right host) through the pool
         full_uri = DEFAULT_URI + uri
-        conn = httplib.HTTPConnection(DEFAULT_HOST)
+        host = DEFAULT_HOST
         if beta:
-            conn = httplib.HTTPConnection("beta.wordnik.com")
+            host = "beta.wordnik.com"
 
-        ## Make the request, get the response
-        conn.request(method, full_uri, body, headers)
-        response = conn.getresponse()
-        ## Save the response code for later (in case we need it)
-        self._http_code = response.status
+        call = None
+        recorder = self.recorder
+        if recorder is not None:
+            call = recorder.call("Wordnik", host + full_uri.split("?")[0],
+                                 bytes_out=len(full_uri) + len(body or "") +
+                                           sum(len(k) + len(str(v)) for k, v in headers.items()))
+        try:
+            response = self.pool.request(host, method, full_uri, body, headers)
+        except Exception, e:
+            if call:
+                call.latency = time.time() - call.started
+                call.error = repr(e)
+                recorder.record(call)
+            raise
+        if call:
+            call.wait = response.wait
+            call.latency = response.latency
+            call.status = response.status
+            call.bytes_in = len(response.body)
+            recorder.record(call)
+        ## Save the response for later (in case we need it), per thread
+        self._local.response = response
+        text = response.body
 
         ## Return meaningful structured data if the call was OK
         if response.status == httplib.OK:
-            text = response.read()
             format_ = headers.get('format', DEFAULT_FORMAT)
             if format_ == FORMAT_JSON:
                 return json.loads(text)
@@ -223,5 +340,5 @@ class Wordnik(object):
         
         ## Otherwise just return what we got
         else:
-            return response.read()
+            return text
             #print >> stderr, "{0}: {1}".format(response.status, response.reason)